@@ -1,4 +1,3 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import (
     HumanMessagePromptTemplate,
     SystemMessagePromptTemplate,
@@ -8,7 +7,12 @@ from langchain_core.prompts import (
 )
 from langchain_community.tools.tavily_search import TavilySearchResults
 from langchain.agents import create_tool_calling_agent, AgentExecutor
+from langchain_core.output_parsers import StrOutputParser, PydanticOutputParser
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
+from functools import lru_cache
+from utils.llm_gateway import get_gateway, PRIORITY_INTERACTIVE, PRIORITY_TITLE
+from utils.metering import metering_context
 
 load_dotenv()
 
@@ -18,6 +22,9 @@ your task is to call the necesaary tools to answer the user question
 * Think step-by-step to fulfill the user's request using the available tools.
 * Prioritize using `document_search` to get information from the document before attempting other actions related to the document (unless the QA tool is requested).
 * Only ask the user for clarification if essential information (like the number of QA pairs or a specific search query) is missing.
+
+Summary of the earlier conversation with the user (empty at the start of a session):
+{summary}
 """
 
 chat_prompts = [
@@ -33,7 +40,77 @@ chat_prompts = [
 
 prompt = ChatPromptTemplate(chat_prompts)
 
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash")
+@lru_cache(maxsize=None)
+def get_llm():
+    """Returns the agent chat model, built on first use."""
+    return get_gateway().chat_model("gemini-2.0-flash", PRIORITY_INTERACTIVE)
+
+summary_prompt = PromptTemplate(
+    template="""You keep a running summary of a study session between a student and an assistant.
+Update the summary with the new messages below. Keep the topics covered, facts and answers the student may ask about again, and any open questions. Use at most 200 words.
+
+Current summary:
+{summary}
+
+New messages:
+{conversation}
+
+Updated summary:""",
+    input_variables=["summary", "conversation"]
+)
+# Tokens of recent messages sent to the agent, older turns are folded into a summary.
+CHAT_HISTORY_TOKEN_BUDGET = 3000
+
+@lru_cache(maxsize=None)
+def get_summary_chain():
+    """Returns the chain folding messages into the rolling summary, built on first use."""
+    return summary_prompt | get_gateway().chat_model("gemini-1.5-flash", PRIORITY_INTERACTIVE, temperature=0) | StrOutputParser()
+
+def summarize_history(previous_summary: str, messages: list) -> str:
+    """
+    Folds older chat messages into the rolling summary of a session.
+
+    Args:
+        previous_summary (str): The current summary, empty for the first fold.
+        messages (list): The HumanMessage/AIMessage objects to add to it.
+
+    Returns:
+        str: The updated summary.
+    """
+    conversation = "\n".join(
+        f"{'Student' if message.type == 'human' else 'Assistant'}: {message.content}" for message in messages
+    )
+    with metering_context(feature="summary"):
+        return get_summary_chain().invoke({"summary": previous_summary or "(empty)", "conversation": conversation}).strip()
+
+class TitleParser(BaseModel):
+    title: str = Field(description="Title of the chat session")
+
+def generate_title_llm(first_message: str) -> str:
+    """Generates the base title (without unique ID)."""
+    title_parser = PydanticOutputParser(pydantic_object=TitleParser)
+    title_prompt = PromptTemplate(
+        template="Based on the given message, suggest a suitable title for the chat (max 5 words).\nMessage: {message}\n{format_instructions}",
+        input_variables=["message"],
+        partial_variables={"format_instructions": title_parser.get_format_instructions()}
+    )
+    gateway = get_gateway()
+    llm = gateway.chat_model("gemini-1.5-flash", PRIORITY_TITLE, temperature=0.2)
+    chain = title_prompt | llm | title_parser
+    try:
+        with metering_context(feature="title"):
+            result = gateway.single_flight(
+                ("title", first_message),
+                lambda: chain.invoke({"message": first_message}),
+                model="gemini-1.5-flash",
+                priority=PRIORITY_TITLE
+            )
+        title = result.title
+        title = title.strip().strip('"')
+        return title if title else "Chat Session"
+    except Exception as e:
+        print(f"Title generation failed: {e}")
+        return "Chat Session"
 
 def get_search_tool() -> TavilySearchResults:
     """Returns the Tavily search tool instance."""
@@ -55,7 +132,7 @@ def get_agent_executor(tools: list) -> AgentExecutor:
     elif not any(isinstance(t, TavilySearchResults) for t in tools):
         tools.append(get_search_tool())
 
-    agent = create_tool_calling_agent(llm=llm, tools=tools, prompt=prompt)
+    agent = create_tool_calling_agent(llm=get_llm(), tools=tools, prompt=prompt)
     agent_executor = AgentExecutor(
         agent=agent,
         tools=tools,
@@ -1,74 +1,14 @@
 import streamlit as st
-from langchain.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.output_parsers import PydanticOutputParser
-from pydantic import BaseModel, Field
-from PyPDF2 import PdfReader
-import docx
-from langchain.schema import Document
-from langchain_core.callbacks.base import BaseCallbackHandler
-import io
 from bson.objectid import ObjectId
 
-from agent import get_agent_executor, get_search_tool
-from ext_tools.qa_tool import qa_generation
-from ext_tools.instant_rag import create_rag_tool
-
-from utils.database import (
-    get_chat_sessions,
-    create_chat_session,
-    prepare_chat_history,
-    add_message_to_session,
-    update_session_name
-)
-
-class LambdaStreamlitLoader:
-    def __init__(self, uploaded_file) -> None:
-        self.uploaded_file = uploaded_file
-        self.file_name = uploaded_file.name
-        if "." in self.file_name:
-            *_, self.ext = self.file_name.rsplit(".", 1)
-            self.ext = self.ext.lower()
-        else:
-            self.ext = ""
+# LangChain, Gemini and document parsing modules are imported where they are first used,
+# so the login screen and the first render do not pay for them.
+from utils.ingestion import get_ingestion_manager
+from utils.service_client import get_service_client
+from utils.messages import to_langchain_messages
+# utils.database is imported where it is used, in thin-client mode (STUDY_BUDDY_SERVICE_URL)
+# the app never connects to MongoDB.
 
-    def lazy_load(self):
-        """Yields Document objects line by line from the uploaded file."""
-        try:
-            file_content = self.uploaded_file.getvalue()
-            if not file_content:
-                 st.warning(f"File '{self.file_name}' appears to be empty.")
-                 return
-
-            if self.ext in ["docx", "doc"]:
-                doc = docx.Document(io.BytesIO(file_content))
-                for paragraph in doc.paragraphs:
-                    lines = paragraph.text.split("\n")
-                    for line in lines:
-                        line = line.strip()
-                        if line:
-                            yield Document(page_content=line, metadata={"source": self.file_name})
-
-            elif self.ext == "pdf":
-                reader = PdfReader(io.BytesIO(file_content))
-                if not reader.pages:
-                    st.warning(f"Could not read any pages from PDF '{self.file_name}'. It might be empty or corrupted.")
-                    return
-                for i, page in enumerate(reader.pages):
-                    text = page.extract_text()
-                    if text:
-                        lines = text.split("\n")
-                        for line in lines:
-                            line = line.strip()
-                            if line:
-                                yield Document(page_content=line, metadata={"source": self.file_name, "page": i + 1})
-            else:
-                st.warning(f"Unsupported file format: '{self.ext if self.ext else 'Unknown'}'. Only PDF or DOCX are processed for context.")
-                return
-
-        except Exception as e:
-            st.error(f"Error processing file '{self.file_name}': {e}")
-            return
 
 def get_base_title(unique_title: str) -> str:
     """Extracts the base title from a unique title (title_sessionid)."""
@@ -84,87 +24,6 @@ def get_base_title(unique_title: str) -> str:
     else:
         return unique_title
 
-class TitleParser(BaseModel):
-    title: str = Field(description="Title of the chat session")
-
-title_parser = PydanticOutputParser(pydantic_object=TitleParser)
-
-def generate_title_llm(first_message: str) -> str:
-    """Generates the base title (without unique ID)."""
-    prompt = PromptTemplate(
-        template="Based on the given message, suggest a suitable title for the chat (max 5 words).\nMessage: {message}\n{format_instructions}",
-        input_variables=["message"],
-        partial_variables={"format_instructions": title_parser.get_format_instructions()}
-    )
-    llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0.2)
-    chain = prompt | llm | title_parser
-    try:
-        result = chain.invoke({"message": first_message})
-        title = result.title
-        title = title.strip().strip('"')
-        return title if title else "Chat Session"
-    except Exception as e:
-        st.error(f"Title generation failed: {e}")
-        return "Chat Session"
-
-class StreamlitCallbackHandler(BaseCallbackHandler):
-    def __init__(self, status):
-        self.status = status
-        self.action = None
-
-    def on_agent_action(self, action, **kwargs):
-        self.action = action
-        tool_input = action.tool_input
-        query = "details"
-        tool_name = action.tool
-
-        if isinstance(tool_input, dict):
-            query = tool_input.get("query", tool_input.get("input", str(tool_input)))
-        elif isinstance(tool_input, str):
-             query = tool_input
-
-        if tool_name == "document_search":
-             self.status.update(label=f"Searching document for: `{query}`")
-        elif tool_name == "tavily_search_results_json":
-             self.status.update(label=f"Searching the web for: `{query}`")
-        elif tool_name == "qa_generation":
-             num_pairs = tool_input.get('number', 'some') if isinstance(tool_input, dict) else 'some'
-             self.status.update(label=f"Generating {num_pairs} Q&A pairs...")
-        else:
-             self.status.update(label=f"Using tool `{tool_name}`...")
-
-
-    def on_tool_start(self, serialized, input_str, **kwargs):
-        tool_name = serialized.get("name", "tool")
-        query = "details"
-        if self.action:
-            tool_input = self.action.tool_input
-            if isinstance(tool_input, dict):
-                query = tool_input.get("query", tool_input.get("input", str(tool_input)))
-            elif isinstance(tool_input, str):
-                query = tool_input
-
-        if tool_name == "document_search":
-            self.status.update(label=f"Processing document search for: `{query}`")
-        elif tool_name == "tavily_search_results_json":
-            self.status.update(label=f"Processing web search for: `{query}`")
-        elif tool_name == "qa_generation":
-            self.status.update(label=f"Processing Q&A generation...")
-        else:
-            self.status.update(label=f"Processing with `{tool_name}`...")
-
-
-    def on_tool_end(self, output, **kwargs):
-        tool_name = self.action.tool if self.action else "tool"
-        if tool_name == "document_search":
-            self.status.update(label="Aggregating document search results")
-        elif tool_name == "tavily_search_results_json":
-            self.status.update(label="Aggregating web search results")
-        elif tool_name == "qa_generation":
-            self.status.update(label="Finalizing Q&A generation")
-        else:
-            self.status.update(label=f"Finished using `{tool_name}`")
-
 def initialize_session_state():
     default_session_state = {
         "logged_in": False,
@@ -176,13 +35,197 @@ def initialize_session_state():
         "session_selected": False,
         "processed_file_id": None,
         "file_docs": None,
-        "tools": [get_search_tool()],
-        "downloadable_csv": None
+        "tools": [],
+        "downloadable_csv": None,
+        "document_handle": None,
+        "tools_document_key": None,
+        "session_list_since": None,
+        "session_list_complete": False,
+        "pinned_session_id": None
     }
     for key, default_value in default_session_state.items():
         if key not in st.session_state:
             st.session_state[key] = default_value
 
+def clear_document_state():
+    """Detaches the uploaded document and its tools from the current chat."""
+    st.session_state.processed_file_id = None
+    st.session_state.file_docs = None
+    st.session_state.tools = []
+    st.session_state.downloadable_csv = None
+    if st.session_state.get("document_handle"):
+        st.session_state.document_handle.release()
+    st.session_state.document_handle = None
+    st.session_state.tools_document_key = None
+
+def select_session(session_id, unique_name: str):
+    """Makes an existing chat the current one."""
+    st.session_state.current_session_id = session_id
+    st.session_state.current_session_title = unique_name
+    st.session_state.needs_title = False
+    st.session_state.session_selected = True
+    clear_document_state()
+
+def reset_session_list():
+    st.session_state.session_list_since = None
+    st.session_state.session_list_complete = False
+    st.session_state.pinned_session_id = None
+
+def load_sessions(service):
+    """
+    Returns the chats listed in the sidebar, newest first, and the cursor of the next older page.
+
+    Only the first page is read until older chats are requested, then every chat from the
+    oldest one loaded onwards, so chats created meanwhile never push one out of the list.
+    """
+    complete = st.session_state.session_list_complete
+    since = None if complete else st.session_state.session_list_since
+    # Without a cursor only the first page is read.
+    page = {"since": since, "limit": None} if complete or since else {}
+    if service:
+        return service.list_sessions(**page)
+    from utils.database import get_chat_sessions_page
+    return get_chat_sessions_page(st.session_state.email, **page)
+
+def load_older_sessions(service, before: str):
+    """Extends the sidebar list by one page of older chats."""
+    try:
+        if service:
+            _, next_cursor = service.list_sessions(before=before)
+        else:
+            from utils.database import get_chat_sessions_page
+            _, next_cursor = get_chat_sessions_page(st.session_state.email, before=before)
+    except Exception as e:
+        st.error(f"Failed to load older chats: {e}")
+        return
+    if next_cursor:
+        st.session_state.session_list_since = next_cursor
+    else:
+        st.session_state.session_list_complete = True
+
+def open_search_result(session_id, unique_name: str):
+    """Opens a chat found by search, it stays listed even if its page is not loaded."""
+    select_session(session_id, unique_name)
+    st.session_state.pinned_session_id = session_id
+    st.session_state.session_search = ""
+
+def render_ingestion_status(handle, polling: bool):
+    """Shows the progress of a background ingestion job and attaches its tools once searchable."""
+    job = handle.entry
+    status = job.snapshot()
+
+    if status["searchable"] and st.session_state.get("tools_document_key") != handle.key:
+        st.session_state.file_docs = job.docs
+        st.session_state.tools = job.tools()
+        st.session_state.tools_document_key = handle.key
+
+    render_document_status(status)
+    if polling and status["state"] not in ("queued", "running"):
+        st.rerun()
+
+def render_remote_document(service, uploaded_file):
+    """Sends a new upload to the chat service and shows the status of the chat's document."""
+    if uploaded_file is not None and uploaded_file.file_id != st.session_state.get("processed_file_id"):
+        clear_document_state()
+        st.session_state.processed_file_id = uploaded_file.file_id
+        try:
+            service.upload_document(st.session_state.current_session_id, uploaded_file.name, uploaded_file.getvalue())
+        except Exception as e:
+            st.error(f"Failed to process file: {e}")
+
+    try:
+        status = service.document_status(st.session_state.current_session_id)
+    except Exception as e:
+        st.error(f"Failed to load the document status: {e}")
+        return
+    if status:
+        polling = status["state"] in ("queued", "running")
+        st.fragment(run_every=2 if polling else None)(render_remote_document_status)(
+            service, st.session_state.current_session_id, polling
+        )
+
+def render_remote_document_status(service, session_id, polling: bool):
+    """Shows the progress of a document ingested by the chat service."""
+    try:
+        status = service.document_status(session_id)
+    except Exception as e:
+        st.warning(f"Failed to load the document status: {e}")
+        return
+    if status:
+        render_document_status(status)
+    if polling and (not status or status["state"] not in ("queued", "running")):
+        st.rerun()
+
+def render_document_status(status: dict):
+    """Renders an ingestion status snapshot: warnings, skipped boilerplate and progress."""
+    for warning in status["warnings"]:
+        st.warning(warning)
+
+    dedup_report = status["dedup_report"]
+    if dedup_report and dedup_report["lines_dropped"]:
+        st.caption(
+            f"Skipped {dedup_report['lines_dropped']} repeated header, footer and page number lines "
+            f"(~{dedup_report['tokens_saved']} tokens not embedded)."
+        )
+
+    if status["state"] in ("queued", "running"):
+        label = f"{status['file_name']}: {status['stage']}"
+        if status["stage"] == "indexing" and status["pages_total"]:
+            label += f" (page {status['pages_indexed']} of {status['pages_total']})"
+        st.progress(status["progress"], text=label)
+        if status["searchable"]:
+            st.caption("Indexed pages are already searchable.")
+    elif status["state"] == "failed":
+        st.warning(f"Failed to process file: {status['error']}")
+    else:
+        st.info(f"File loaded. Document tools active.")
+
+def chat_metering(session_id):
+    """Attributes the LLM calls of a chat turn to the current user and chat."""
+    from utils.metering import metering_context
+
+    return metering_context(user_id=st.session_state.email, session_id=str(session_id), feature="chat")
+
+def friendly_error_message(error: str) -> str:
+    error_message = f"An error occurred while processing your request: {error}. Please try again."
+    if "Daily quota" in error:
+         error_message = f"You have reached your daily usage limit. {error}"
+    elif "rate limit" in error.lower() or "429" in error:
+         error_message = "Apologies, the system is experiencing high load (rate limit exceeded). Please try again in a few moments."
+    elif "API key not valid" in error:
+         error_message = "Configuration error: An API key is invalid. Please contact support."
+    return error_message
+
+def run_remote_turn(service, prompt_text: str):
+    """Runs a chat turn on the chat service, streaming its progress and answer into the page."""
+    status = st.status("Processing your request...", expanded=False)
+    answer_box = st.chat_message("assistant").empty()
+    streamed = ""
+    done = False
+    try:
+        for event in service.chat(st.session_state.current_session_id, prompt_text):
+            if event["type"] == "title":
+                st.session_state.current_session_title = event["title"]
+                st.session_state.needs_title = False
+            elif event["type"] == "status":
+                status.update(label=event["label"])
+            elif event["type"] == "token":
+                streamed += event["text"]
+                answer_box.markdown(streamed)
+            elif event["type"] == "done":
+                status.update(label="Done!", state="complete", expanded=True)
+                answer_box.markdown(event["answer"])
+                if event.get("downloadable_csv"):
+                    st.session_state.downloadable_csv = event["downloadable_csv"]
+                done = True
+            elif event["type"] == "error":
+                raise RuntimeError(event["error"])
+    except Exception as e:
+        status.update(label=f"Error: Processing failed.", state="error", expanded=True)
+        answer_box.error(friendly_error_message(str(e)))
+    if done:
+        st.rerun()
+
 initialize_session_state()
 
 if not st.experimental_user.is_logged_in:
@@ -224,10 +267,12 @@ else:
         st.session_state.current_session_title = ""
         st.session_state.needs_title = False
         st.session_state.session_selected = False
-        st.session_state.processed_file_id = None
-        st.session_state.file_docs = None
-        st.session_state.tools = [get_search_tool()]
-        st.session_state.downloadable_csv = None
+        clear_document_state()
+        reset_session_list()
+
+# With STUDY_BUDDY_SERVICE_URL set, sessions, uploads and chat turns are handled by the
+# headless chat service (service.py) and this script only renders.
+service = get_service_client(st.session_state.email)
 
 
 with st.sidebar:
@@ -235,15 +280,16 @@ with st.sidebar:
 
     if st.button("➕ Create New Chat"):
         try:
-            new_session_id, unique_name = create_chat_session(user_id=st.session_state.email, session_name="New Chat")
+            if service:
+                new_session_id, unique_name = service.create_session("New Chat")
+            else:
+                from utils.database import create_chat_session
+                new_session_id, unique_name = create_chat_session(user_id=st.session_state.email, session_name="New Chat")
             st.session_state.current_session_id = new_session_id
             st.session_state.current_session_title = unique_name
             st.session_state.needs_title = True
             st.session_state.session_selected = True
-            st.session_state.processed_file_id = None
-            st.session_state.file_docs = None
-            st.session_state.tools = [get_search_tool()]
-            st.session_state.downloadable_csv = None
+            clear_document_state()
             st.success("New chat created. Send your first message!")
             st.rerun()
         except Exception as e:
@@ -259,61 +305,72 @@ with st.sidebar:
             key=uploader_key
         )
 
-        if uploaded_file is not None and uploaded_file.file_id != st.session_state.get("processed_file_id"):
-            try:
-                with st.spinner(f"Processing file: {uploaded_file.name}..."):
-                    loader = LambdaStreamlitLoader(uploaded_file)
-                    docs = list(loader.lazy_load())
-
-                    if docs:
-                        st.session_state.file_docs = docs
-                        st.session_state.processed_file_id = uploaded_file.file_id
-                        st.success(f"File '{uploaded_file.name}' uploaded successfully! Preparing document tools...")
-
-                        current_tools = [get_search_tool()]
-
-                        rag_tool = create_rag_tool(st.session_state.file_docs)
-                        if rag_tool:
-                            current_tools.append(rag_tool)
-
-                        qa_tool = qa_generation
-                        current_tools.append(qa_tool)
-
-                        st.session_state.tools = current_tools
-                        st.session_state.downloadable_csv = None
-
-                        st.rerun()
-
-                    else:
-                        st.warning(f"Could not extract content from '{uploaded_file.name}'. Tools requiring document context will not be added.")
-                        st.session_state.processed_file_id = uploaded_file.file_id
-                        st.session_state.file_docs = None
-                        st.session_state.tools = [get_search_tool()]
-                        st.session_state.downloadable_csv = None
-                        st.rerun()
-
-            except Exception as e:
-                st.error(f"Failed to process file: {e}")
-                st.session_state.processed_file_id = uploaded_file.file_id
-                st.session_state.file_docs = None
-                st.session_state.tools = [get_search_tool()]
-                st.session_state.downloadable_csv = None
-                st.rerun()
+        if service:
+            render_remote_document(service, uploaded_file)
+        else:
+            ingestion_manager = get_ingestion_manager()
+            if uploaded_file is not None and uploaded_file.file_id != st.session_state.get("processed_file_id"):
+                try:
+                    clear_document_state()
+                    st.session_state.document_handle = ingestion_manager.submit(
+                        owner=st.session_state.email,
+                        session_id=st.session_state.current_session_id,
+                        file_name=uploaded_file.name,
+                        file_content=uploaded_file.getvalue()
+                    )
+                    st.session_state.processed_file_id = uploaded_file.file_id
+                except Exception as e:
+                    st.error(f"Failed to process file: {e}")
+                    clear_document_state()
+                    st.session_state.processed_file_id = uploaded_file.file_id
+
+            elif not st.session_state.get("document_handle") and st.session_state.current_session_id:
+                # Re-attach the document uploaded to this chat before a refresh or a chat switch.
+                st.session_state.document_handle = ingestion_manager.attach(
+                    st.session_state.email, st.session_state.current_session_id
+                )
 
-        if st.session_state.get("file_docs"):
-            st.info(f"File loaded. Document tools active.")
-        elif st.session_state.get("processed_file_id") and not st.session_state.get("file_docs"):
-             st.warning("A file was processed, but no content was loaded or an error occurred.")
+            document_handle = st.session_state.get("document_handle")
+            if document_handle:
+                polling = document_handle.entry.active
+                st.fragment(run_every=2 if polling else None)(render_ingestion_status)(document_handle, polling)
     else:
         st.info("Select or create a chat to enable file upload.")
     
 
     st.divider()
+    search_text = st.text_input("Search Chats", key="session_search", placeholder="Search titles and messages").strip()
+    if search_text:
+        try:
+            if service:
+                search_results = service.search_sessions(search_text)
+            else:
+                from utils.database import search_chat_sessions
+                search_results = search_chat_sessions(st.session_state.email, search_text)
+        except Exception as e:
+            st.error(f"Failed to search chats: {e}")
+            search_results = []
+        if not search_results:
+            st.caption("No chats match your search.")
+        for sid, unique_name in search_results:
+            st.button(
+                get_base_title(unique_name),
+                key=f"search_result_{sid}",
+                on_click=open_search_result,
+                args=(sid, unique_name),
+                use_container_width=True
+            )
+
     try:
-        sessions_list = list(get_chat_sessions(user_id=st.session_state.email))
+        sessions_list, older_sessions_cursor = load_sessions(service)
     except Exception as e:
         st.error(f"Failed to load chat sessions: {e}")
-        sessions_list = []
+        sessions_list, older_sessions_cursor = [], None
+
+    pinned_session_id = st.session_state.pinned_session_id
+    if pinned_session_id and pinned_session_id == st.session_state.current_session_id:
+        if pinned_session_id not in [sid for sid, unique_name in sessions_list]:
+            sessions_list = [(pinned_session_id, st.session_state.current_session_title)] + sessions_list
 
     if sessions_list:
         session_options = {unique_name: sid for sid, unique_name in sessions_list}
@@ -327,14 +384,7 @@ with st.sidebar:
             except ValueError:
                 if session_unique_names:
                     first_unique_name = session_unique_names[0]
-                    st.session_state.current_session_id = session_options[first_unique_name]
-                    st.session_state.current_session_title = first_unique_name
-                    st.session_state.needs_title = False
-                    st.session_state.session_selected = True
-                    st.session_state.processed_file_id = None
-                    st.session_state.file_docs = None
-                    st.session_state.tools = [get_search_tool()]
-                    st.session_state.downloadable_csv = None
+                    select_session(session_options[first_unique_name], first_unique_name)
                     current_index = 0
                     st.rerun()
                 else:
@@ -342,10 +392,7 @@ with st.sidebar:
                     st.session_state.current_session_title = ""
                     st.session_state.needs_title = False
                     st.session_state.session_selected = False
-                    st.session_state.processed_file_id = None
-                    st.session_state.file_docs = None
-                    st.session_state.tools = [get_search_tool()]
-                    st.session_state.downloadable_csv = None
+                    clear_document_state()
 
         if session_unique_names:
             selected_session_name = st.selectbox(
@@ -358,16 +405,17 @@ with st.sidebar:
 
             selected_session_id = session_options.get(selected_session_name)
             if selected_session_id and selected_session_id != st.session_state.current_session_id:
-                st.session_state.current_session_id = selected_session_id
-                st.session_state.current_session_title = selected_session_name
-                st.session_state.needs_title = False
-                st.session_state.session_selected = True
-                st.session_state.processed_file_id = None
-                st.session_state.file_docs = None
-                st.session_state.tools = [get_search_tool()]
-                st.session_state.downloadable_csv = None
+                select_session(selected_session_id, selected_session_name)
                 st.rerun()
 
+        if older_sessions_cursor:
+            st.button(
+                "Load older chats",
+                on_click=load_older_sessions,
+                args=(service, older_sessions_cursor),
+                use_container_width=True
+            )
+
     else:
         st.warning("No previous chats found. Create one!")
     
@@ -379,14 +427,18 @@ if st.session_state.logged_in and st.session_state.session_selected and st.sessi
     st.subheader(f"Chat: {display_title}", anchor=False)
 
     try:
-        session_id_obj = st.session_state.current_session_id
-        if not isinstance(session_id_obj, ObjectId):
-             session_id_obj = ObjectId(session_id_obj)
+        if service:
+            messages = to_langchain_messages(service.messages(st.session_state.current_session_id, limit=50))
+        else:
+            from utils.database import prepare_chat_history
+            session_id_obj = st.session_state.current_session_id
+            if not isinstance(session_id_obj, ObjectId):
+                 session_id_obj = ObjectId(session_id_obj)
 
-        messages = prepare_chat_history(
-            session_id=session_id_obj,
-            chat_history_limit=50
-        )
+            messages = prepare_chat_history(
+                session_id=session_id_obj,
+                chat_history_limit=50
+            )
     except Exception as e:
         st.error(f"Failed to load chat history: {e}")
         messages = []
@@ -412,6 +464,11 @@ if st.session_state.logged_in and st.session_state.session_selected and st.sessi
     prompt_text = st.chat_input("Ask your questions...")
     if prompt_text:
         st.chat_message("user").markdown(prompt_text)
+        if service:
+            run_remote_turn(service, prompt_text)
+            st.stop()
+
+        from utils.database import add_message_to_session, update_session_name, prepare_agent_history
 
         session_id_to_use = st.session_state.current_session_id
         if not isinstance(session_id_to_use, ObjectId):
@@ -424,7 +481,8 @@ if st.session_state.logged_in and st.session_state.session_selected and st.sessi
         title_generated_in_this_run = False
         if st.session_state.needs_title:
             try:
-                with st.spinner("Generating title"):
+                with st.spinner("Generating title"), chat_metering(session_id_to_use):
+                    from agent import generate_title_llm
                     base_title = generate_title_llm(prompt_text)
                 new_unique_title = update_session_name(session_id_to_use, base_title)
                 if new_unique_title:
@@ -449,19 +507,24 @@ if st.session_state.logged_in and st.session_state.session_selected and st.sessi
         except Exception as e:
              st.error(f"Failed to save your message: {e}")
 
+        summary = ""
         try:
-            messages = prepare_chat_history(
-                session_id=session_id_to_use,
-                chat_history_limit=50
-            )
+            from agent import summarize_history, CHAT_HISTORY_TOKEN_BUDGET
+            with chat_metering(session_id_to_use):
+                summary, messages = prepare_agent_history(
+                    session_id=session_id_to_use,
+                    token_budget=CHAT_HISTORY_TOKEN_BUDGET,
+                    summarize=summarize_history
+                )
         except Exception as e:
             st.error(f"Failed to reload chat history: {e}")
 
 
-        agent_input = {"input": prompt_text, "chat_history": messages}
+        agent_input = {"input": prompt_text, "summary": summary, "chat_history": messages}
 
-        current_tools = st.session_state.get("tools", [get_search_tool()])
+        current_tools = st.session_state.get("tools", [])
         try:
+            from agent import get_agent_executor
             agent_executor = get_agent_executor(tools=current_tools)
         except Exception as agent_init_e:
              st.error(f"Failed to initialize the AI agent: {agent_init_e}")
@@ -470,11 +533,13 @@ if st.session_state.logged_in and st.session_state.session_selected and st.sessi
 
         with st.status("Processing your request...", expanded=False) as status:
             try:
+                from utils.callbacks import StreamlitCallbackHandler
                 callback_handler = StreamlitCallbackHandler(status)
-                response = agent_executor.invoke(
-                    agent_input,
-                    config={"callbacks": [callback_handler]}
-                )
+                with chat_metering(session_id_to_use):
+                    response = agent_executor.invoke(
+                        agent_input,
+                        config={"callbacks": [callback_handler]}
+                    )
 
                 output = response.get("output", "Sorry, I couldn't process that.")
                 status.update(label="Done!", state="complete", expanded=True)
@@ -492,12 +557,6 @@ if st.session_state.logged_in and st.session_state.session_selected and st.sessi
 
                 st.rerun()
             except Exception as e:
-                error_message = f"An error occurred while processing your request: {e}. Please try again."
-                if "rate limit" in str(e).lower() or "429" in str(e):
-                     error_message = "Apologies, the system is experiencing high load (rate limit exceeded). Please try again in a few moments."
-                elif "API key not valid" in str(e):
-                     error_message = "Configuration error: An API key is invalid. Please contact support."
-
-
+                error_message = friendly_error_message(str(e))
                 status.update(label=f"Error: Processing failed.", state="error", expanded=True)
                 st.chat_message("assistant").error(error_message)
\ No newline at end of file
@@ -0,0 +1,318 @@
+import re
+from bisect import bisect_right
+from typing import TYPE_CHECKING, List, Optional
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# Numbered ("2.1 Cell Division", "3) Results"), roman ("IV. Methods") or keyword ("Chapter 3")
+# headings. The title after the number must start with a capital, wrapped sentence lines
+# often start with a number too ("2020 was a good year for").
+HEADING_PATTERN = re.compile(
+    r"^((\d+(\.\d+)*[.)]?\s+[A-Z])|([IVXLC]+\.\s+[A-Z])"
+    r"|((?i:chapter|section|unit|lesson|module|part|topic)\s+(\d+|[IVXLC]+\b|[A-Z])))"
+)
+SENTENCE_END = (".", "!", "?", ":", ";", '."', ".)")
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for Gemini style tokenizers (about 4 characters per token)."""
+    if not text:
+        return 0
+    return max(1, (len(text) + 3) // 4)
+
+
+def is_heading(line: str) -> bool:
+    """Heuristically decides whether a single extracted line is a heading."""
+    line = line.strip()
+    if not line or len(line) > 80 or line.endswith((".", ",", ";", "?", "!")):
+        return False
+    words = line.split()
+    if len(words) > 12:
+        return False
+    if HEADING_PATTERN.match(line) and len(words) > 1:
+        return True
+    letters = [c for c in line if c.isalpha()]
+    if len(letters) >= 3 and line.isupper():
+        return True
+    return False
+
+
+def _split_long_text(text: str, max_tokens: int) -> List[str]:
+    """Splits a paragraph that is larger than the budget on sentence, then word, boundaries."""
+    pieces = []
+    current = ""
+    for sentence in SENTENCE_SPLIT.split(text):
+        if estimate_tokens(sentence) > max_tokens:
+            words = sentence.split()
+            for word in words:
+                candidate = f"{current} {word}".strip()
+                if current and estimate_tokens(candidate) > max_tokens:
+                    pieces.append(current)
+                    current = word
+                else:
+                    current = candidate
+            continue
+        candidate = f"{current} {sentence}".strip()
+        if current and estimate_tokens(candidate) > max_tokens:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _paragraphs(documents: List["Document"]):
+    """
+    Rebuilds paragraphs from line level Documents.
+
+    Yields (kind, text, metadata, first_line, end_line) tuples where kind is "heading" or
+    "paragraph" and the line range indexes `documents`. A paragraph ends when a line
+    finishes a sentence, when the source changes, or when a heading is found.
+    """
+    buffer = []
+    buffer_meta = None
+    buffer_start = 0
+
+    def flush(end_line):
+        if buffer:
+            return ("paragraph", " ".join(buffer), buffer_meta, buffer_start, end_line)
+        return None
+
+    for index, doc in enumerate(documents):
+        line = doc.page_content.strip()
+        if not line:
+            continue
+        meta = doc.metadata or {}
+
+        if buffer_meta is not None and meta.get("source") != buffer_meta.get("source"):
+            item = flush(index)
+            if item:
+                yield item
+            buffer, buffer_meta = [], None
+
+        if is_heading(line):
+            item = flush(index)
+            if item:
+                yield item
+            buffer, buffer_meta = [], None
+            yield ("heading", line, meta, index, index + 1)
+            continue
+
+        if not buffer:
+            buffer_meta = meta
+            buffer_start = index
+        buffer.append(line)
+        if line.endswith(SENTENCE_END):
+            item = flush(index + 1)
+            if item:
+                yield item
+            buffer, buffer_meta = [], None
+
+    item = flush(len(documents))
+    if item:
+        yield item
+
+
+def chunk_documents(
+    documents: List["Document"],
+    max_tokens: int = 400,
+    overlap_tokens: int = 50,
+) -> List["Document"]:
+    """
+    Merges line level Documents into structure aware chunks.
+
+    Lines are first joined back into paragraphs, paragraphs are then packed into chunks of
+    at most `max_tokens` tokens. A heading always starts a new chunk and is kept as the
+    "section" metadata of every chunk that follows it. When a chunk is closed because the
+    budget was reached, its last paragraph is carried over to the next chunk if it fits in
+    `overlap_tokens`.
+
+    Args:
+        documents (List[Document]): Line level documents, as produced by the file loader.
+        max_tokens (int): Token budget per chunk.
+        overlap_tokens (int): Largest trailing paragraph repeated at the start of the next chunk.
+
+    Returns:
+        List[Document]: The merged chunks with "source", "page", "page_end", "section" metadata
+        and the "line_start"/"line_end" range of `documents` they were built from.
+    """
+    from langchain_core.documents import Document
+
+    chunks = []
+    parts = []
+    part_lines = []
+    part_tokens = 0
+    chunk_meta = None
+    section: Optional[str] = None
+    last_page = None
+
+    def close(carry: bool):
+        nonlocal parts, part_lines, part_tokens, chunk_meta
+        if not parts:
+            return
+        metadata = {"source": chunk_meta.get("source"), "line_start": part_lines[0][0], "line_end": part_lines[-1][1]}
+        if chunk_meta.get("page") is not None:
+            metadata["page"] = chunk_meta["page"]
+            metadata["page_end"] = last_page if last_page is not None else chunk_meta["page"]
+        if section:
+            metadata["section"] = section
+        chunks.append(Document(page_content="\n".join(parts), metadata=metadata))
+
+        tail = parts[-1]
+        if carry and len(parts) > 1 and estimate_tokens(tail) <= overlap_tokens:
+            parts = [tail]
+            part_lines = part_lines[-1:]
+            part_tokens = estimate_tokens(tail)
+            chunk_meta = {**chunk_meta, "page": last_page}
+        else:
+            parts, part_lines, part_tokens, chunk_meta = [], [], 0, None
+
+    for kind, text, meta, first_line, end_line in _paragraphs(documents):
+        if chunk_meta is not None and meta.get("source") != chunk_meta.get("source"):
+            close(carry=False)
+            section = None
+
+        if kind == "heading":
+            close(carry=False)
+            section = text
+            chunk_meta = dict(meta)
+            parts = [text]
+            part_lines = [(first_line, end_line)]
+            part_tokens = estimate_tokens(text)
+            last_page = meta.get("page")
+            continue
+
+        for piece in _split_long_text(text, max_tokens):
+            tokens = estimate_tokens(piece)
+            if parts and part_tokens + tokens > max_tokens:
+                close(carry=True)
+            if chunk_meta is None:
+                chunk_meta = dict(meta)
+            parts.append(piece)
+            part_lines.append((first_line, end_line))
+            part_tokens += tokens
+            last_page = meta.get("page")
+
+    close(carry=False)
+    return chunks
+
+
+class ParentWindows:
+    """
+    Expands matched chunks to the section or page around them (small-to-big retrieval).
+
+    Chunks are kept small so the search matches precisely, and each hit is then widened to
+    the lines of its section, or of its pages if the section is too long, or to as many
+    neighbouring lines as fit in `max_window_tokens`. Section and page starts and the token
+    prefix sums of the line level documents are computed once, so a window costs a couple
+    of binary searches.
+
+    Args:
+        documents (List[Document]): The line level documents the chunks were built from.
+        max_window_tokens (int): Token budget of the window around one hit.
+        max_total_tokens (int): Token budget of everything returned for one search.
+    """
+
+    def __init__(self, documents: List["Document"], max_window_tokens: int = 800, max_total_tokens: int = 2400) -> None:
+        self.documents = documents
+        self.max_window_tokens = max_window_tokens
+        self.max_total_tokens = max_total_tokens
+        self._prefix = [0]
+        self._section_starts = []
+        self._page_starts = []
+
+        previous = None
+        for index, doc in enumerate(documents):
+            line = doc.page_content.strip()
+            meta = doc.metadata or {}
+            self._prefix.append(self._prefix[-1] + estimate_tokens(line))
+            new_source = previous is None or meta.get("source") != previous.get("source")
+            if new_source or is_heading(line):
+                self._section_starts.append(index)
+            if new_source or meta.get("page") != previous.get("page"):
+                self._page_starts.append(index)
+            previous = meta
+
+    def tokens(self, start: int, end: int) -> int:
+        return self._prefix[end] - self._prefix[start]
+
+    def _bounds(self, starts: List[int], index: int) -> tuple:
+        position = bisect_right(starts, index) - 1
+        end = starts[position + 1] if position + 1 < len(starts) else len(self.documents)
+        return starts[position], end
+
+    def window(self, start: int, end: int) -> tuple:
+        """Returns the (start, end) line range to show for a chunk covering lines [start, end)."""
+        section_start, section_end = self._bounds(self._section_starts, start)
+        section = (min(section_start, start), max(section_end, end))
+        if self.tokens(*section) <= self.max_window_tokens:
+            return section
+
+        pages = (
+            max(section[0], self._bounds(self._page_starts, start)[0]),
+            min(section[1], self._bounds(self._page_starts, end - 1)[1]),
+        )
+        if self.tokens(*pages) <= self.max_window_tokens:
+            return pages
+
+        # Grow one line at a time on each side while the window fits.
+        lower, upper = pages
+        grown = True
+        while grown:
+            grown = False
+            if start > lower and self.tokens(start - 1, end) <= self.max_window_tokens:
+                start -= 1
+                grown = True
+            if end < upper and self.tokens(start, end + 1) <= self.max_window_tokens:
+                end += 1
+                grown = True
+        return start, end
+
+    def document(self, start: int, end: int) -> "Document":
+        from langchain_core.documents import Document
+
+        lines = self.documents[start:end]
+        metadata = {"source": (lines[0].metadata or {}).get("source"), "line_start": start, "line_end": end}
+        pages = [doc.metadata["page"] for doc in lines if (doc.metadata or {}).get("page") is not None]
+        if pages:
+            metadata["page"] = min(pages)
+            metadata["page_end"] = max(pages)
+        heading = self.documents[self._bounds(self._section_starts, start)[0]].page_content.strip()
+        if is_heading(heading):
+            metadata["section"] = heading
+        text = "\n".join(doc.page_content.strip() for doc in lines if doc.page_content.strip())
+        return Document(page_content=text, metadata=metadata)
+
+    def expand(self, chunks: List["Document"]) -> List["Document"]:
+        """
+        Replaces search hits by their windows, best hit first.
+
+        Overlapping or adjacent windows are merged into one. Once the total budget is
+        reached a hit falls back to its own lines, and is dropped if even those don't fit.
+        """
+        selected = []
+        used = 0
+        for chunk in chunks:
+            start, end = chunk.metadata["line_start"], chunk.metadata["line_end"]
+            for candidate in (self.window(start, end), (start, end)):
+                overlapping = [window for window in selected if window[0] <= candidate[1] and candidate[0] <= window[1]]
+                merged = (
+                    min([candidate[0]] + [window[0] for window in overlapping]),
+                    max([candidate[1]] + [window[1] for window in overlapping]),
+                )
+                extra = self.tokens(*merged) - sum(self.tokens(*window) for window in overlapping)
+                if used + extra > self.max_total_tokens:
+                    continue
+                if overlapping:
+                    position = selected.index(overlapping[0])
+                    selected = [window for window in selected if window not in overlapping]
+                    selected.insert(position, merged)
+                else:
+                    selected.append(merged)
+                used += extra
+                break
+        return [self.document(start, end) for start, end in selected]
@@ -0,0 +1,157 @@
+import math
+import re
+from typing import TYPE_CHECKING, List, Tuple
+import numpy as np
+from ext_tools.chunker import estimate_tokens
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+MERSENNE_PRIME = (1 << 31) - 1
+DIGITS = re.compile(r"\d+")
+NON_WORD = re.compile(r"[^\w#]+")
+
+
+def normalize_line(line: str, page: int = None) -> str:
+    """
+    Lowercases a line and drops punctuation. A number equal to `page` is masked, so
+    "Page 3 of 40" on page 3 matches "Page 4 of 40" on page 4, other numbers are kept.
+    """
+    line = DIGITS.sub(lambda match: "#" if page is not None and int(match.group()) == page else match.group(), line.lower())
+    return " ".join(NON_WORD.sub(" ", line).split())
+
+
+def shingles(text: str, k: int = 4) -> frozenset:
+    """Character k-grams of `text` (the whole text if it is shorter than k)."""
+    return frozenset(text[i:i + k] for i in range(max(1, len(text) - k + 1)))
+
+
+class MinHashLSH:
+    """
+    Clusters near duplicate texts with MinHash signatures and banded LSH.
+
+    Every cluster is represented by its first text (its leader), only leaders are kept in
+    the LSH buckets. A new text joins the first candidate leader whose exact Jaccard
+    similarity reaches `threshold`, otherwise it becomes a new leader. Comparing against
+    leaders only keeps chains of slightly different lines from merging unrelated text.
+    """
+
+    def __init__(self, num_perm: int = 32, bands: int = 8, threshold: float = 0.8, seed: int = 1) -> None:
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self._buckets = {}
+        self._leaders = []
+
+    def signature(self, grams: frozenset) -> np.ndarray:
+        # Python's string hash is only stable within a process, which is all the index needs.
+        hashes = np.fromiter((hash(g) & MERSENNE_PRIME for g in grams), dtype=np.uint64, count=len(grams))
+        return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) % np.uint64(MERSENNE_PRIME)).min(axis=1)
+
+    def add(self, text: str) -> int:
+        """Returns the cluster id of `text`, creating a new cluster if no leader is similar enough."""
+        grams = shingles(text)
+        signature = self.signature(grams)
+        keys = [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+        candidates = set()
+        for key in keys:
+            candidates.update(self._buckets.get(key, ()))
+        for leader in sorted(candidates):
+            other = self._leaders[leader]
+            if len(grams & other) >= self.threshold * len(grams | other):
+                return leader
+
+        leader = len(self._leaders)
+        self._leaders.append(grams)
+        for key in keys:
+            self._buckets.setdefault(key, []).append(leader)
+        return leader
+
+
+def remove_boilerplate(
+    documents: List["Document"],
+    page_fraction: float = 0.3,
+    min_pages: int = 3,
+    edge_lines: int = 2,
+    max_line_chars: int = 160,
+    threshold: float = 0.8,
+) -> Tuple[List["Document"], dict]:
+    """
+    Collapses running headers, footers, page numbers and other repeated lines.
+
+    Only the first and last `edge_lines` lines of every page, where running headers and
+    footers sit, are candidates. They are grouped with `MinHashLSH` into clusters of near
+    duplicates. A cluster that shows up on at least `min_pages` pages and on `page_fraction`
+    of all pages is boilerplate: its first occurrence is kept and every other one is dropped.
+    Documents without page metadata (DOCX) are returned untouched.
+
+    Args:
+        documents (List[Document]): Line level documents, as produced by the file loader.
+        page_fraction (float): Share of the pages a line must repeat on to be boilerplate.
+        min_pages (int): Smallest number of pages a line must repeat on to be boilerplate.
+        edge_lines (int): Lines at the top and at the bottom of a page that are compared.
+        max_line_chars (int): Longer lines are body text and are never compared.
+        threshold (float): Estimated Jaccard similarity for two lines to be near duplicates.
+
+    Returns:
+        Tuple[List[Document], dict]: The kept documents and a report of what was removed.
+    """
+    pages = {doc.metadata.get("page") for doc in documents if doc.metadata.get("page") is not None}
+    report = {"lines_in": len(documents), "lines_dropped": 0, "chars_dropped": 0, "tokens_saved": 0, "examples": []}
+    required_pages = max(min_pages, math.ceil(page_fraction * len(pages)))
+    if len(pages) < required_pages:
+        return list(documents), report
+
+    page_lines = {}
+    for position, doc in enumerate(documents):
+        if doc.metadata.get("page") is not None:
+            page_lines.setdefault(doc.metadata["page"], []).append(position)
+    edges = set()
+    for positions in page_lines.values():
+        edges.update(positions[:edge_lines])
+        edges.update(positions[-edge_lines:])
+
+    lsh = MinHashLSH(threshold=threshold)
+    text_clusters = {}
+    line_clusters = []
+    for position, doc in enumerate(documents):
+        if position not in edges:
+            line_clusters.append(None)
+            continue
+        text = normalize_line(doc.page_content, doc.metadata["page"])
+        if not text or len(text) > max_line_chars:
+            line_clusters.append(None)
+            continue
+        if text != "#" and not any(c.isalpha() for c in text):
+            # Rows of numbers (tables, answers) are content, only a bare page number counts.
+            line_clusters.append(None)
+            continue
+        if text not in text_clusters:
+            text_clusters[text] = lsh.add(text)
+        line_clusters.append(text_clusters[text])
+
+    cluster_pages = {}
+    for doc, cluster in zip(documents, line_clusters):
+        if cluster is not None:
+            cluster_pages.setdefault(cluster, set()).add(doc.metadata["page"])
+    boilerplate = {cluster for cluster, seen in cluster_pages.items() if len(seen) >= required_pages}
+
+    kept = []
+    seen_clusters = set()
+    for doc, cluster in zip(documents, line_clusters):
+        if cluster in boilerplate:
+            if cluster in seen_clusters:
+                report["lines_dropped"] += 1
+                report["chars_dropped"] += len(doc.page_content)
+                report["tokens_saved"] += estimate_tokens(doc.page_content)
+                continue
+            seen_clusters.add(cluster)
+            if len(report["examples"]) < 5:
+                report["examples"].append(doc.page_content)
+        kept.append(doc)
+
+    return kept, report
@@ -1,49 +1,64 @@
-import streamlit as st
 from langchain.tools import tool
 from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.tools.retriever import create_retriever_tool
 from langchain.schema import Document
-from typing import List
+from langchain_core.retrievers import BaseRetriever
+from typing import Any, List
 
-def create_rag_tool(documents: List[Document], embeddings_model_name: str = "models/embedding-001"):
+DOCUMENT_SEARCH_DESCRIPTION = "Use this tool *only* to answer questions about the content of the uploaded document. Pass the user's question directly as input to the tool. Each result includes the section or pages around the match, so one search usually gives enough context."
+
+
+class SharedIndexRetriever(BaseRetriever):
+    """
+    FAISS retriever that stays searchable while a background job is still adding vectors.
+
+    Hits are expanded to the text around them by the document's `ParentWindows`.
+    """
+    vectorstore: Any
+    embedding: Any
+    lock: Any
+    windows: Any
+    k: int = 5
+
+    def _get_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        vector = self.embedding.embed_query(query)
+        with self.lock:
+            chunks = self.vectorstore.similarity_search_by_vector(vector, k=self.k)
+        return self.windows.expand(chunks)
+
+
+def add_chunks_to_index(vectorstore, chunks: List[Document], embedding, lock):
+    """
+    Embeds `chunks` and adds them to `vectorstore`, creating the index on the first call.
+
+    Embedding happens outside of `lock` so searches are only blocked while the vectors are
+    written into the index.
     """
-    Creates a Langchain retrieval tool from a list of Document objects.
+    texts = [chunk.page_content for chunk in chunks]
+    metadatas = [chunk.metadata for chunk in chunks]
+    vectors = embedding.embed_documents(texts)
+    with lock:
+        if vectorstore is None:
+            return FAISS.from_embeddings(list(zip(texts, vectors)), embedding, metadatas=metadatas)
+        vectorstore.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+        return vectorstore
+
 
-    Args:
-        documents (List[Document]): The list of documents loaded from the file.
-        embeddings_model_name (str): The name of the embedding model to use.
+def make_retrieval_tool(vectorstore, embedding, lock, windows):
+    """
+    Wraps a FAISS index into the `document_search` tool used by the agent.
 
-    Returns:
-        BaseRetrieverTool: The configured Langchain retrieval tool, or None if error.
+    `lock` guards the index while it is still being built, `windows` is the `ParentWindows`
+    of the indexed document.
     """
-    if not documents:
-        st.warning("No documents provided to create RAG tool.")
-        return None
-
-    try:
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-        docs_split = text_splitter.split_documents(documents)
-
-        if not docs_split:
-            st.warning("Document content was empty after splitting.")
-            return None
-
-        embedding = GoogleGenerativeAIEmbeddings(model=embeddings_model_name)
-
-        vectorstore = FAISS.from_documents(docs_split, embedding)
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
-
-        retrieval_tool = create_retriever_tool(
-            retriever=retriever,
-            name="document_search",
-            description="Use this tool *only* to answer questions about the content of the uploaded document. Pass the user's question directly as input to the tool."
-        )
-        print("RAG tool created successfully.")
-        return retrieval_tool
-
-    except Exception as e:
-        st.error(f"Failed to create RAG tool: {e}")
-        print(f"Error creating RAG tool: {e}")
-        return None
\ No newline at end of file
+    retriever = SharedIndexRetriever(
+        vectorstore=vectorstore,
+        embedding=embedding,
+        lock=lock,
+        windows=windows,
+    )
+    return create_retriever_tool(
+        retriever=retriever,
+        name="document_search",
+        description=DOCUMENT_SEARCH_DESCRIPTION
+    )
@@ -0,0 +1,75 @@
+import io
+
+
+class LambdaStreamlitLoader:
+    def __init__(self, uploaded_file) -> None:
+        self.uploaded_file = uploaded_file
+        self.file_name = uploaded_file.name
+        if "." in self.file_name:
+            *_, self.ext = self.file_name.rsplit(".", 1)
+            self.ext = self.ext.lower()
+        else:
+            self.ext = ""
+        self.total_pages = None
+        self.warnings = []
+
+    def lazy_load(self):
+        """
+        Yields Document objects line by line from the uploaded file.
+
+        Problems are collected in `self.warnings` instead of being rendered, so the loader
+        can run outside of the Streamlit script thread. `self.total_pages` is set as soon as
+        the page count of a PDF is known.
+        """
+        from langchain_core.documents import Document
+
+        try:
+            file_content = self.uploaded_file.getvalue()
+            if not file_content:
+                 self.warnings.append(f"File '{self.file_name}' appears to be empty.")
+                 return
+
+            if self.ext in ["docx", "doc"]:
+                import docx
+                doc = docx.Document(io.BytesIO(file_content))
+                self.total_pages = 1
+                for paragraph in doc.paragraphs:
+                    lines = paragraph.text.split("\n")
+                    for line in lines:
+                        line = line.strip()
+                        if line:
+                            yield Document(page_content=line, metadata={"source": self.file_name})
+
+            elif self.ext == "pdf":
+                from PyPDF2 import PdfReader
+                reader = PdfReader(io.BytesIO(file_content))
+                if not reader.pages:
+                    self.warnings.append(f"Could not read any pages from PDF '{self.file_name}'. It might be empty or corrupted.")
+                    return
+                self.total_pages = len(reader.pages)
+                for i, page in enumerate(reader.pages):
+                    text = page.extract_text()
+                    if text:
+                        lines = text.split("\n")
+                        for line in lines:
+                            line = line.strip()
+                            if line:
+                                yield Document(page_content=line, metadata={"source": self.file_name, "page": i + 1})
+            else:
+                self.warnings.append(f"Unsupported file format: '{self.ext if self.ext else 'Unknown'}'. Only PDF or DOCX are processed for context.")
+                return
+
+        except Exception as e:
+            self.warnings.append(f"Error processing file '{self.file_name}': {e}")
+            return
+
+
+class InMemoryFile:
+    """Minimal stand-in for a Streamlit UploadedFile, holding a snapshot of the file bytes."""
+
+    def __init__(self, name: str, content: bytes) -> None:
+        self.name = name
+        self._content = content
+
+    def getvalue(self) -> bytes:
+        return self._content
@@ -9,6 +9,9 @@ from typing import List
 import pandas as pd
 from io import StringIO
 from datetime import datetime
+from functools import lru_cache
+from utils.llm_gateway import get_gateway, gemini_client_kwargs, PRIORITY_BATCH
+from utils.metering import get_meter, metering_context, current_context
 
 
 class QAParser(BaseModel):
@@ -27,8 +30,17 @@ prompt = PromptTemplate(
     input_variables=["number", "context"]
 )
 parser = PydanticOutputParser(pydantic_object=QAParser)
-llm_qa = GoogleGenerativeAI(model="gemini-1.5-flash", google_api_key=os.environ.get("GOOGLE_API_KEY"))
-chain = prompt.partial(format_instructions=parser.get_format_instructions()) | llm_qa | parser
+
+@lru_cache(maxsize=None)
+def get_qa_chain():
+    """Returns the Q&A generation chain, the LLM client is only built on first use."""
+    llm_qa = GoogleGenerativeAI(
+        model="gemini-1.5-flash",
+        google_api_key=os.environ.get("GOOGLE_API_KEY"),
+        callbacks=[get_meter().callback("gemini-1.5-flash")],
+        **gemini_client_kwargs()
+    )
+    return prompt.partial(format_instructions=parser.get_format_instructions()) | llm_qa | parser
 
 
 def create_csv(qa_data: QAParser) -> str:
@@ -45,6 +57,41 @@ def create_csv(qa_data: QAParser) -> str:
         raise
 
 
+def generate_qa_csv(file_docs, number: int) -> dict:
+    """
+    Generates question-answer pairs from document context and packs them as a CSV download.
+
+    Args:
+        file_docs: The document lines used as context.
+        number: The number of question-answer pairs to generate.
+
+    Returns:
+        dict: The filename, content, mime type and number of pairs of the CSV.
+    """
+    # Checked before queueing for a rate limit token, the LLM callback checks again.
+    get_meter().check_quota(current_context().get("user_id"))
+    # Sessions sharing a document share the same file_docs object, so identical
+    # concurrent requests are sent to Gemini only once.
+    with metering_context(feature="qa_generation"):
+        qa_data = get_gateway().run(
+            "gemini-1.5-flash",
+            PRIORITY_BATCH,
+            lambda: get_qa_chain().invoke({"number": number, "context": file_docs}),
+            dedup_key=("qa", id(file_docs), number)
+        )
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return {
+        "filename": f"qa_pairs_{timestamp}.csv",
+        "content": create_csv(qa_data),
+        "mime": "text/csv",
+        "count": len(qa_data.questions)
+    }
+
+
+QA_SUCCESS_MESSAGE = "Successfully generated {count} question-answer pairs, download with button below now to avoid losing the data."
+
+
 @tool("qa_generation", return_direct=False)
 def qa_generation(number: int) -> str:
     """
@@ -62,21 +109,37 @@ def qa_generation(number: int) -> str:
             error_msg = "No document context found in session state. Please upload a document first."
             return error_msg
 
-        qa_data = chain.invoke({"number": number, "context": st.session_state.file_docs})
+        csv_data = generate_qa_csv(st.session_state.file_docs, number)
+        st.session_state['downloadable_csv'] = csv_data
+        return QA_SUCCESS_MESSAGE.format(count=csv_data["count"])
+
+    except Exception as e:
+        error_response = f"An error occurred during question-answer generation: {e}"
+        return error_response
+
 
-        csv_content = create_csv(qa_data)
+def make_qa_tool(file_docs, downloads: list):
+    """
+    Returns a `qa_generation` tool bound to one document instead of the Streamlit session,
+    for use outside of the Streamlit script. Generated CSVs are appended to `downloads`.
+    """
+    @tool("qa_generation", return_direct=False)
+    def qa_generation_for_document(number: int) -> str:
+        """
+        Generates a specified number of question-answer pairs based on document context,
+        saves them as a CSV, adds an AI message to the session, and prepares for download.
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"qa_pairs_{timestamp}.csv"
-        st.session_state['downloadable_csv'] = {
-            "filename": filename,
-            "content": csv_content,
-            "mime": "text/csv"
-        }
+        Args:
+            number: The number of question-answer pairs to generate.
 
-        ai_message = f"Successfully generated {len(qa_data.questions)} question-answer pairs, download with button below now to avoid losing the data."
-        return ai_message
+        Returns:
+            A confirmation message string.
+        """
+        try:
+            csv_data = generate_qa_csv(file_docs, number)
+            downloads.append(csv_data)
+            return QA_SUCCESS_MESSAGE.format(count=csv_data["count"])
+        except Exception as e:
+            return f"An error occurred during question-answer generation: {e}"
 
-    except Exception as e:
-        error_response = f"An error occurred during question-answer generation: {e}"
-        return error_response
\ No newline at end of file
+    return qa_generation_for_document
@@ -0,0 +1,46 @@
+"""
+Offline checks of the messages the app sends to Gemini.
+
+    python -m loadtest.checks
+
+`loadtest.run` runs them before starting the simulated students.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def check_summary_prompt():
+    """The agent prompt with a rolling summary must still be accepted by the Gemini client."""
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langchain_google_genai.chat_models import _parse_chat_history
+    from agent import prompt
+
+    messages = prompt.format_messages(
+        input="And the second one?",
+        summary="The student asked about the first chapter of their biology notes.",
+        chat_history=[HumanMessage(content="What is chapter one about?"), AIMessage(content="Cells.")],
+        agent_scratchpad=[],
+    )
+    system_instruction, contents = _parse_chat_history(messages)
+    assert system_instruction is not None, "the system prompt was not sent as a system instruction"
+    assert "first chapter of their biology notes" in system_instruction.parts[0].text, "the summary is missing"
+    assert [content.role for content in contents] == ["user", "model", "user"], contents
+
+
+CHECKS = [check_summary_prompt]
+
+
+def main():
+    os.environ.setdefault("GOOGLE_API_KEY", "load-test")
+    os.environ.setdefault("TAVILY_API_KEY", "load-test")
+    for check in CHECKS:
+        check()
+        print(f"ok {check.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+In-process MongoDB stand-in for load tests: mongomock behind a configurable delay.
+
+`install(latency)` replaces `pymongo.MongoClient` before `utils.database` is imported, so
+the app's own `prepare_db_coll` ends up with these collections.
+"""
+import threading
+import time
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+# Collection methods that cost a round trip to the server.
+ROUND_TRIP_METHODS = {
+    "find", "find_one", "insert_one", "insert_many", "update_one", "update_many",
+    "delete_one", "delete_many", "aggregate", "count_documents", "bulk_write",
+    "create_index", "find_one_and_update", "replace_one",
+}
+
+
+class LatencyCollection:
+    """Wraps a mongomock collection, sleeping `latency` seconds before each round trip."""
+
+    def __init__(self, collection, latency: float, stats: dict, lock: threading.Lock) -> None:
+        self._collection = collection
+        self._latency = latency
+        self._stats = stats
+        self._lock = lock
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if name not in ROUND_TRIP_METHODS:
+            return attribute
+
+        def call(*args, **kwargs):
+            with self._lock:
+                self._stats[name] = self._stats.get(name, 0) + 1
+            time.sleep(self._latency)
+            return attribute(*args, **kwargs)
+        return call
+
+
+class LatencyDatabase:
+    def __init__(self, database, latency: float, stats: dict, lock: threading.Lock) -> None:
+        self._database = database
+        self._latency = latency
+        self._stats = stats
+        self._lock = lock
+
+    def __getitem__(self, name):
+        return LatencyCollection(self._database[name], self._latency, self._stats, self._lock)
+
+    def __getattr__(self, name):
+        return getattr(self._database, name)
+
+
+class LatencyMongoClient:
+    """Drop-in for `pymongo.MongoClient` backed by one shared in-memory mongomock server."""
+
+    latency = 0.005
+    stats = {}
+    _lock = threading.Lock()
+    _client = None
+
+    def __init__(self, *args, **kwargs) -> None:
+        with LatencyMongoClient._lock:
+            if LatencyMongoClient._client is None:
+                LatencyMongoClient._client = mongomock.MongoClient()
+
+    def __getitem__(self, name):
+        return LatencyDatabase(LatencyMongoClient._client[name], self.latency, self.stats, self._lock)
+
+
+def install(latency: float = 0.005):
+    """Makes every later `pymongo.MongoClient(...)` return the in-memory stand-in."""
+    if mongomock is None:
+        raise RuntimeError("The load test MongoDB stand-in needs `pip install mongomock`.")
+    import pymongo
+    LatencyMongoClient.latency = latency
+    pymongo.MongoClient = LatencyMongoClient
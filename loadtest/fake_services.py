@@ -0,0 +1,146 @@
+"""
+Local stand-ins for the Gemini REST API and Tavily search, for load tests.
+
+Responses are canned but well formed, so the real LangChain clients parse them. The agent
+model answers with a `document_search` function call first whenever that tool is offered,
+which exercises the retrieval path, then with a plain text answer.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_SIZE = 64
+
+
+def fake_embedding(text: str) -> list:
+    """Deterministic unit-length vector derived from the text hash."""
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    rng = random.Random(seed)
+    values = [rng.uniform(-1, 1) for _ in range(EMBEDDING_SIZE)]
+    norm = sum(v * v for v in values) ** 0.5
+    return [v / norm for v in values]
+
+
+def _text_of(content: dict) -> str:
+    return " ".join(part.get("text", "") for part in content.get("parts", []))
+
+
+def _generate(body: dict) -> dict:
+    contents = body.get("contents", [])
+    last = contents[-1] if contents else {}
+    prompt = _text_of(last)
+    tools = [
+        declaration["name"]
+        for tool in body.get("tools", [])
+        for declaration in tool.get("functionDeclarations", tool.get("function_declarations", []))
+    ]
+    answered_tool = any("functionResponse" in part or "function_response" in part for part in last.get("parts", []))
+
+    if "document_search" in tools and not answered_tool:
+        part = {"functionCall": {"name": "document_search", "args": {"query": prompt[:200]}}}
+    elif "suggest a suitable title" in prompt:
+        part = {"text": json.dumps({"title": "Load test chat"})}
+    elif re.search(r"generate \d+ questions", prompt):
+        number = int(re.search(r"generate (\d+) questions", prompt).group(1))
+        part = {"text": json.dumps({
+            "questions": [f"Question {i + 1}?" for i in range(number)],
+            "answers": [f"Answer {i + 1}." for i in range(number)],
+        })}
+    else:
+        part = {"text": f"This is a simulated answer to: {prompt[:120]}"}
+
+    prompt_tokens = sum(len(_text_of(c)) for c in contents) // 4
+    return {
+        "candidates": [{"content": {"parts": [part], "role": "model"}, "finishReason": "STOP", "index": 0}],
+        "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": 40, "totalTokenCount": prompt_tokens + 40},
+    }
+
+
+class FakeServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, payload: dict, status: int = 200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        server.count(self.path)
+        time.sleep(server.latency_for(self.path))
+
+        path = self.path.split("?", 1)[0]
+        if path.endswith(":generateContent"):
+            self._reply(_generate(body))
+        elif path.endswith(":streamGenerateContent"):
+            # REST streaming is a JSON array of partial responses, one chunk is enough here.
+            self._reply([_generate(body)])
+        elif path.endswith(":batchEmbedContents"):
+            self._reply({"embeddings": [
+                {"values": fake_embedding(_text_of(request.get("content", {})))} for request in body.get("requests", [])
+            ]})
+        elif path.endswith(":embedContent"):
+            self._reply({"embedding": {"values": fake_embedding(_text_of(body.get("content", {})))}})
+        elif path == "/search":
+            query = body.get("query", "")
+            self._reply({"query": query, "results": [
+                {"title": f"Result {i + 1}", "url": f"https://example.com/{i + 1}",
+                 "content": f"Simulated web result {i + 1} for {query}", "score": 0.9 - i * 0.1}
+                for i in range(body.get("max_results", 5))
+            ]})
+        else:
+            self._reply({"error": {"code": 404, "message": f"Unknown path {path}"}}, status=404)
+
+
+class FakeServices(ThreadingHTTPServer):
+    """Threaded HTTP server answering Gemini and Tavily requests after a configurable delay."""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, llm_latency: float = 0.5,
+                 embedding_latency: float = 0.05, search_latency: float = 0.3) -> None:
+        super().__init__((host, port), FakeServiceHandler)
+        self.llm_latency = llm_latency
+        self.embedding_latency = embedding_latency
+        self.search_latency = search_latency
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def latency_for(self, path: str) -> float:
+        if "Embed" in path:
+            return self.embedding_latency
+        if path.startswith("/search"):
+            return self.search_latency
+        return self.llm_latency
+
+    def count(self, path: str):
+        kind = path.split("?", 1)[0].rsplit(":", 1)[-1] if ":" in path else path
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    def start(self) -> "FakeServices":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-services", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
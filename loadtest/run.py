@@ -0,0 +1,283 @@
+"""
+Concurrent-session load test for the Study Buddy app.
+
+Drives simulated students through the real `app.py` script with Streamlit's AppTest:
+log in, create a chat, upload a document and ask questions. Gemini, embeddings and Tavily
+are served by `loadtest.fake_services`, MongoDB by `loadtest.fake_mongo`, each with a
+configurable delay. Prints throughput, turn latency percentiles and memory per session.
+
+    python -m loadtest.run --users 20 --questions 3 --llm-latency 0.5
+
+AppTest cannot drive `st.file_uploader`, so the upload step hands the file to the app's
+ingestion manager exactly like the uploader branch of `app.py` does, then reruns the page.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from loadtest import checks, fake_mongo
+from loadtest.fake_services import FakeServices
+
+QUESTIONS = [
+    "Summarize the main idea of chapter one.",
+    "What is the role of the membrane in the cell?",
+    "Explain photosynthesis in simple terms.",
+    "Which topics should I revise before the exam?",
+    "Give me an example related to the second section.",
+]
+TOPICS = ["cell", "membrane", "photosynthesis", "enzyme", "energy", "protein", "water", "carbon"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=10, help="Number of concurrent simulated students")
+    parser.add_argument("--questions", type=int, default=3, help="Questions asked by each student")
+    parser.add_argument("--document", help="PDF or DOCX to upload (default: a generated DOCX)")
+    parser.add_argument("--distinct-documents", action="store_true", help="Give every student a different document")
+    parser.add_argument("--no-upload", action="store_true", help="Skip the upload step")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per fake Gemini generation")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Seconds per fake embedding request")
+    parser.add_argument("--search-latency", type=float, default=0.3, help="Seconds per fake Tavily search")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="Seconds per fake MongoDB round trip")
+    parser.add_argument("--rpm", type=float, default=100000, help="Gemini requests per minute allowed by the gateway")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Seconds a student waits between questions")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds allowed for one page run")
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the app's own console output")
+    return parser.parse_args(argv)
+
+
+def generate_document(paragraphs: int = 300, variant: int = 0) -> bytes:
+    """Builds a DOCX study note with headings and paragraphs."""
+    import docx
+
+    rng = random.Random(variant)
+    document = docx.Document()
+    for index in range(paragraphs):
+        if index % 25 == 0:
+            document.add_paragraph(f"CHAPTER {index // 25 + 1} {rng.choice(TOPICS).upper()}")
+        words = [rng.choice(TOPICS) for _ in range(rng.randint(20, 60))]
+        document.add_paragraph(f"Note {variant}-{index}: " + " ".join(words) + ".")
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def configure_environment(args, services: FakeServices):
+    """Points every external client of the app at the local stand-ins."""
+    os.environ["GEMINI_API_ENDPOINT"] = services.url
+    os.environ["GEMINI_DEFAULT_RPM"] = str(args.rpm)
+    os.environ.setdefault("GOOGLE_API_KEY", "load-test")
+    os.environ.setdefault("TAVILY_API_KEY", "load-test")
+    os.environ.setdefault("DATABASE_URL", "mongodb://load-test")
+    fake_mongo.install(latency=args.db_latency)
+
+    import langchain_community.utilities.tavily_search as tavily_search
+    tavily_search.TAVILY_API_URL = services.url
+
+    # GoogleGenerativeAIEmbeddings accepts `transport` but does not pass it on, and the
+    # fake server only speaks REST.
+    import langchain_google_genai.embeddings as embeddings
+    build = embeddings.build_generative_service
+    embeddings.build_generative_service = lambda **kwargs: build(transport="rest", **kwargs)
+
+    # Log every simulated student in with the identity stored in their session state.
+    import streamlit.user_info as user_info
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    def simulated_user_info():
+        ctx = get_script_run_ctx()
+        if ctx is not None and "_loadtest_user" in ctx.session_state:
+            return dict(ctx.session_state["_loadtest_user"])
+        return {"is_logged_in": False}
+    user_info._get_user_info = simulated_user_info
+
+    # Each AppTest run installs a mock Runtime singleton and clears it when done, which
+    # breaks the other students' runs still in flight. Keep one shared mock around instead.
+    from unittest.mock import MagicMock
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+
+    shared_runtime = MagicMock(spec=Runtime)
+    shared_runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    shared_runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: cls._instance or shared_runtime)
+
+    # Every AppTest run also compiles app.py into a fresh script cache, and compiling on
+    # many threads at once trips CPython's parser. Compile once for all students.
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    compiled = {}
+    compile_lock = threading.Lock()
+    get_bytecode = ScriptCache.get_bytecode
+
+    def shared_bytecode(self, script_path):
+        with compile_lock:
+            if script_path not in compiled:
+                compiled[script_path] = get_bytecode(self, script_path)
+            return compiled[script_path]
+    ScriptCache.get_bytecode = shared_bytecode
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process (Linux), 0 where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class SimulatedStudent:
+    def __init__(self, index: int, args, document: tuple) -> None:
+        from streamlit.testing.v1 import AppTest
+
+        self.index = index
+        self.args = args
+        self.document = document
+        self.email = f"student{index}@loadtest.local"
+        self.app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=args.timeout)
+        self.app.session_state["_loadtest_user"] = {
+            "is_logged_in": True, "email": self.email, "name": f"Student {index}"
+        }
+        self.timings = {"login": None, "create_chat": None, "ingest": None, "turns": []}
+        self.errors = []
+
+    def _run(self, step: str, action):
+        start = time.perf_counter()
+        action()
+        elapsed = time.perf_counter() - start
+        if self.app.exception:
+            self.errors.append(f"{step}: {self.app.exception[0].value}")
+        return elapsed
+
+    def run(self):
+        try:
+            self.timings["login"] = self._run("login", self.app.run)
+            create = next(b for b in self.app.sidebar.button if "Create New Chat" in b.label)
+            self.timings["create_chat"] = self._run("create_chat", lambda: create.click().run())
+
+            if not self.args.no_upload:
+                self.timings["ingest"] = self._upload()
+
+            for number in range(self.args.questions):
+                question = QUESTIONS[(self.index + number) % len(QUESTIONS)]
+                self.timings["turns"].append(
+                    self._run(f"turn {number + 1}", lambda: self.app.chat_input[0].set_value(question).run())
+                )
+                if self.args.think_time:
+                    time.sleep(self.args.think_time)
+        except Exception as e:
+            self.errors.append(f"{type(e).__name__}: {e}")
+        return self
+
+    def _upload(self) -> float:
+        from utils.ingestion import get_ingestion_manager
+
+        file_name, content = self.document
+        start = time.perf_counter()
+        handle = get_ingestion_manager().submit(
+            owner=self.email,
+            session_id=self.app.session_state["current_session_id"],
+            file_name=file_name,
+            file_content=content
+        )
+        self.app.session_state["document_handle"] = handle
+        while handle.entry.active:
+            time.sleep(0.05)
+        self._run("upload", self.app.run)
+        if handle.entry.state == "failed":
+            self.errors.append(f"upload: {handle.entry.error}")
+        return time.perf_counter() - start
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    services = FakeServices(
+        llm_latency=args.llm_latency,
+        embedding_latency=args.embedding_latency,
+        search_latency=args.search_latency
+    ).start()
+    configure_environment(args, services)
+    for check in checks.CHECKS:
+        check()
+
+    if args.document:
+        with open(args.document, "rb") as document_file:
+            shared_document = (os.path.basename(args.document), document_file.read())
+    else:
+        shared_document = ("loadtest_notes.docx", generate_document())
+
+    def document_for(index):
+        if not args.distinct_documents:
+            return shared_document
+        return (f"loadtest_notes_{index}.docx", generate_document(variant=index + 1))
+
+    rss_before = rss_bytes()
+    students = [SimulatedStudent(i, args, document_for(i)) for i in range(args.users)]
+    start = time.perf_counter()
+    # The agent executor is verbose, keep its output out of the report unless asked for.
+    with ThreadPoolExecutor(max_workers=args.users) as pool, \
+            contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+        list(pool.map(lambda student: student.run(), students))
+    elapsed = time.perf_counter() - start
+    rss_after = rss_bytes()
+
+    turns = [t for s in students for t in s.timings["turns"]]
+    ingests = [s.timings["ingest"] for s in students if s.timings["ingest"] is not None]
+    logins = [s.timings["login"] for s in students if s.timings["login"] is not None]
+    errors = [f"student {s.index}: {error}" for s in students for error in s.errors]
+
+    from utils.llm_gateway import get_gateway
+    report = {
+        "users": args.users,
+        "questions_per_user": args.questions,
+        "wall_seconds": round(elapsed, 3),
+        "turns": len(turns),
+        "turns_per_second": round(len(turns) / elapsed, 3) if elapsed else None,
+        "turn_latency_seconds": {
+            "p50": round(percentile(turns, 50), 3),
+            "p95": round(percentile(turns, 95), 3),
+            "p99": round(percentile(turns, 99), 3),
+            "max": round(max(turns), 3) if turns else None,
+        },
+        "login_p50_seconds": round(percentile(logins, 50), 3),
+        "ingest_p50_seconds": round(percentile(ingests, 50), 3) if ingests else None,
+        "memory_per_session_mb": round((rss_after - rss_before) / args.users / 2**20, 2) if rss_before else None,
+        "fake_service_requests": dict(services.requests),
+        "mongo_round_trips": dict(fake_mongo.LatencyMongoClient.stats),
+        "gateway": get_gateway().metrics(),
+        "errors": errors[:20],
+        "error_count": len(errors),
+    }
+    services.stop()
+
+    print(json.dumps(report, indent=2, default=str))
+    if args.json:
+        with open(args.json, "w") as report_file:
+            json.dump(report, report_file, indent=2, default=str)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 import os
 import streamlit as st
+from utils.warmup import start_background_warm_up, warm_up_enabled
+from utils.archiver import start_background_archiver, archive_after_days
 
 st.set_page_config(
     page_title="Study Buddy",
@@ -7,6 +9,24 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
+
+@st.cache_resource
+def warm_up_once():
+    """Starts the optional warm-up (STUDY_BUDDY_WARMUP=1) once per server process."""
+    return start_background_warm_up()
+
+if warm_up_enabled():
+    warm_up_once()
+
+@st.cache_resource
+def archiver_once():
+    """Starts the session archiving job (SESSION_ARCHIVE_AFTER_DAYS) once per server process."""
+    return start_background_archiver()
+
+# In thin-client mode (STUDY_BUDDY_SERVICE_URL) the chat service workers run the archiver.
+if archive_after_days() is not None and not os.environ.get("STUDY_BUDDY_SERVICE_URL", "").strip():
+    archiver_once()
+
 cwd = os.getcwd()
 main_page = st.Page(page=os.path.join(cwd, "app.py"), title="Home", icon="🎓")
 feedback_page = st.Page(page=os.path.join(cwd, "utils", "feedback.py"), title="Feedbacks", icon="🗒️")
@@ -0,0 +1,388 @@
+"""
+Headless Study Buddy chat service.
+
+Serves chat sessions, document uploads and streamed chat turns over HTTP, so the chat
+logic can run outside of the Streamlit script. Worker processes share nothing but MongoDB
+and the on-disk document index directory, so they can be spread across cores and nodes:
+
+    python service.py --port 8600 --workers 4
+
+Every request names the user in the `X-User-Email` header. Run the service on a private
+network, or set STUDY_BUDDY_SERVICE_TOKEN and send `Authorization: Bearer <token>`.
+
+Routes:
+    GET  /health
+    GET  /sessions?before=&since=&limit=20    a page of the user's chats, newest first
+    GET  /sessions?q=                         search the user's chat titles and messages
+    POST /sessions                            {"name": ...} create a chat
+    GET  /sessions/{id}/messages?limit=50     latest messages of a chat
+    POST /sessions/{id}/documents?file_name=  raw PDF/DOCX body, starts ingestion
+    GET  /sessions/{id}/documents             ingestion status of the chat's document
+    POST /sessions/{id}/chat                  {"message": ...} streams newline delimited JSON events
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from aiohttp import web
+from bson.errors import InvalidId
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from utils.database import (
+    get_session,
+    get_chat_sessions_page,
+    search_chat_sessions,
+    SESSION_PAGE_SIZE,
+    create_chat_session,
+    update_session_name,
+    add_message_to_session,
+    prepare_agent_history,
+    set_session_document
+)
+from utils.doc_store import DocumentStore
+from utils.index_store import IndexStore
+from utils.ingestion import IngestionManager
+
+NEW_CHAT_NAME = "New Chat"
+
+INGESTION = web.AppKey("ingestion", IngestionManager)
+INDEXES = web.AppKey("indexes", IndexStore)
+DB_EXECUTOR = web.AppKey("db_executor", ThreadPoolExecutor)
+TURN_EXECUTOR = web.AppKey("turn_executor", ThreadPoolExecutor)
+BACKGROUND_TASKS = web.AppKey("background_tasks", set)
+
+
+def json_error(error_class, message: str):
+    return error_class(text=json.dumps({"error": message}), content_type="application/json")
+
+
+async def blocking(request, fn, *args):
+    """
+    Runs a short blocking call (MongoDB, job submission) on the worker's database thread pool.
+
+    Chat turns run on their own pool, so listing chats or polling a document is never
+    queued behind slow LLM calls.
+    """
+    return await asyncio.get_running_loop().run_in_executor(request.app[DB_EXECUTOR], partial(fn, *args))
+
+
+async def read_json(request) -> dict:
+    try:
+        body = await request.json()
+    except ValueError:
+        raise json_error(web.HTTPBadRequest, "Request body must be JSON.")
+    if not isinstance(body, dict):
+        raise json_error(web.HTTPBadRequest, "Request body must be a JSON object.")
+    return body
+
+
+@web.middleware
+async def auth_middleware(request, handler):
+    if request.path == "/health":
+        return await handler(request)
+    token = os.environ.get("STUDY_BUDDY_SERVICE_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        raise json_error(web.HTTPUnauthorized, "Invalid service token.")
+    user = request.headers.get("X-User-Email", "").strip()
+    if not user:
+        raise json_error(web.HTTPUnauthorized, "Missing X-User-Email header.")
+    request["user"] = user
+    return await handler(request)
+
+
+async def owned_session(request, projection: dict = None) -> dict:
+    session = await blocking(request, get_session, request.match_info["session_id"], request["user"], projection)
+    if session is None:
+        raise json_error(web.HTTPNotFound, "Chat session not found.")
+    return session
+
+
+def document_status(app, session: dict):
+    """
+    Returns the ingestion status of a chat's document, wherever it is being processed.
+
+    A job running in this worker reports live progress, a finished index is read from disk,
+    otherwise the record on the session tells whether another worker is still on it.
+    """
+    document = session.get("document")
+    if not document:
+        return None
+    handle = app[INGESTION].store.acquire(document["key"])
+    if handle is not None:
+        status = handle.entry.snapshot()
+        handle.release()
+        return status
+    meta = app[INDEXES].meta(document["key"])
+    if meta is not None:
+        return meta
+    state = document.get("state", "queued")
+    return {
+        "id": document["key"], "file_name": document["file_name"],
+        "state": state, "stage": "done" if state == "failed" else "indexing", "progress": 0.0,
+        "pages_total": None, "pages_indexed": 0, "chunks_total": 0, "chunks_indexed": 0,
+        "warnings": [], "error": document.get("error"), "dedup_report": None, "searchable": False,
+    }
+
+
+def document_tools(app, session: dict, downloads: list) -> list:
+    """Returns the document tools of a chat, from this worker's memory or from disk."""
+    document = session.get("document")
+    if not document:
+        return []
+    handle = app[INGESTION].store.acquire(document["key"])
+    if handle is not None:
+        tools = handle.entry.tools(downloads)
+        handle.release()
+        if tools:
+            return tools
+    loaded = app[INDEXES].load(document["key"])
+    return loaded.tools(downloads) if loaded is not None else []
+
+
+def run_chat_turn(app, session: dict, message: str, emit) -> None:
+    """Runs one chat turn on a worker thread, reporting progress through `emit(event)`."""
+    from agent import generate_title_llm, get_agent_executor, summarize_history, CHAT_HISTORY_TOKEN_BUDGET
+    from utils.callbacks import StreamlitCallbackHandler, EventStatus, TokenStreamHandler
+    from utils.metering import metering_context
+
+    session_id = session["_id"]
+    try:
+        with metering_context(user_id=session["user_id"], session_id=str(session_id), feature="chat"):
+            title = None
+            if not session.get("messages") and session.get("session_name", "").startswith(f"{NEW_CHAT_NAME}_"):
+                title = update_session_name(session_id, generate_title_llm(message))
+                if title:
+                    emit({"type": "title", "title": title})
+
+            add_message_to_session(session_id=session_id, content=message, kind="user")
+            summary, messages = prepare_agent_history(
+                session_id=session_id,
+                token_budget=CHAT_HISTORY_TOKEN_BUDGET,
+                summarize=summarize_history
+            )
+
+            downloads = []
+            agent_executor = get_agent_executor(tools=document_tools(app, session, downloads))
+            response = agent_executor.invoke(
+                {"input": message, "summary": summary, "chat_history": messages},
+                config={"callbacks": [StreamlitCallbackHandler(EventStatus(emit)), TokenStreamHandler(emit)]}
+            )
+            output = str(response.get("output", "Sorry, I couldn't process that."))
+            add_message_to_session(session_id=session_id, content=output, kind="ai")
+            emit({
+                "type": "done",
+                "answer": output,
+                "title": title,
+                "downloadable_csv": downloads[-1] if downloads else None
+            })
+    except Exception as e:
+        print(f"Chat turn for session {session_id} failed: {e}")
+        emit({"type": "error", "error": str(e)})
+
+
+async def record_document_outcome(app, session_id, file_name: str, job) -> None:
+    """Waits for an ingestion job and stores its outcome on the session for the other workers."""
+    while job.active:
+        await asyncio.sleep(1)
+    document = {"key": job.key, "file_name": file_name, "state": job.state, "error": job.error}
+    await asyncio.get_running_loop().run_in_executor(
+        app[DB_EXECUTOR], set_session_document, session_id, document, job.key
+    )
+
+
+async def health(request):
+    return web.json_response({"status": "ok", "pid": os.getpid()})
+
+
+async def list_sessions(request):
+    """
+    Returns a page of the user's sessions, newest first, with the cursor of the next page.
+
+    Query parameters: `before` and `since` cursors (see `get_chat_sessions_page`), `limit`
+    (0 for no limit, used with `since`), or `q` to search titles and messages instead.
+    """
+    try:
+        limit = min(max(0, int(request.query.get("limit", SESSION_PAGE_SIZE))), 100)
+    except ValueError:
+        raise json_error(web.HTTPBadRequest, "limit must be an integer.")
+    text = request.query.get("q", "").strip()
+    if text:
+        sessions = await blocking(request, search_chat_sessions, request["user"], text, limit or SESSION_PAGE_SIZE)
+        next_cursor = None
+    else:
+        try:
+            sessions, next_cursor = await blocking(
+                request, get_chat_sessions_page, request["user"],
+                request.query.get("before") or None, request.query.get("since") or None, limit or None
+            )
+        except (ValueError, InvalidId):
+            raise json_error(web.HTTPBadRequest, "Invalid session cursor.")
+    return web.json_response({
+        "sessions": [{"id": str(session_id), "name": name} for session_id, name in sessions],
+        "next": next_cursor
+    })
+
+
+async def create_session(request):
+    body = await read_json(request) if request.can_read_body else {}
+    session_id, unique_name = await blocking(request, create_chat_session, request["user"], body.get("name") or NEW_CHAT_NAME)
+    return web.json_response({"id": str(session_id), "name": unique_name}, status=201)
+
+
+async def session_messages(request):
+    try:
+        limit = max(1, int(request.query.get("limit", "50")))
+    except ValueError:
+        raise json_error(web.HTTPBadRequest, "limit must be an integer.")
+    session = await owned_session(request, {"messages": 1})
+    messages = session.get("messages", [])[-limit:]
+    return web.json_response([{"kind": m.get("kind"), "content": m.get("content", "")} for m in messages])
+
+
+async def upload_document(request):
+    session = await owned_session(request, {"_id": 1})
+    file_name = request.query.get("file_name", "").strip()
+    if not file_name:
+        raise json_error(web.HTTPBadRequest, "file_name is required.")
+    file_content = await request.read()
+    if not file_content:
+        raise json_error(web.HTTPBadRequest, f"File '{file_name}' appears to be empty.")
+
+    handle = await blocking(request, request.app[INGESTION].submit, request["user"], session["_id"], file_name, file_content)
+    job = handle.entry
+    status = job.snapshot()
+    # Finished indexes live on disk, the in-memory copy only has to outlive the job.
+    handle.release()
+    await blocking(request, set_session_document, session["_id"], {"key": job.key, "file_name": file_name, "state": job.state})
+    if job.active:
+        task = asyncio.get_running_loop().create_task(record_document_outcome(request.app, session["_id"], file_name, job))
+        request.app[BACKGROUND_TASKS].add(task)
+        task.add_done_callback(request.app[BACKGROUND_TASKS].discard)
+    return web.json_response(status, status=202)
+
+
+async def get_document_status(request):
+    session = await owned_session(request, {"document": 1})
+    return web.json_response(await blocking(request, document_status, request.app, session))
+
+
+async def chat(request):
+    session = await owned_session(request, {"user_id": 1, "session_name": 1, "document": 1, "messages": {"$slice": -1}})
+    body = await read_json(request)
+    message = str(body.get("message", "")).strip()
+    if not message:
+        raise json_error(web.HTTPBadRequest, "message is required.")
+
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    emit = lambda event: loop.call_soon_threadsafe(events.put_nowait, event)
+    # The turn keeps running if the client goes away, so the answer is still saved.
+    turn = loop.run_in_executor(request.app[TURN_EXECUTOR], run_chat_turn, request.app, session, message, emit)
+    try:
+        while True:
+            event = await events.get()
+            await response.write((json.dumps(event, default=str) + "\n").encode())
+            if event["type"] in ("done", "error"):
+                break
+        await response.write_eof()
+    except ConnectionResetError:
+        pass
+    await turn
+    return response
+
+
+def create_app() -> web.Application:
+    app = web.Application(
+        client_max_size=int(os.environ.get("STUDY_BUDDY_MAX_UPLOAD_MB", "200")) * 1024 * 1024,
+        middlewares=[auth_middleware]
+    )
+    app[INDEXES] = IndexStore(os.environ.get("DOCUMENT_INDEX_DIR", os.path.join(".study_buddy", "indexes")))
+    app[INGESTION] = IngestionManager(
+        store=DocumentStore(max_bytes=int(os.environ.get("DOCUMENT_STORE_MAX_MB", "512")) * 1024 * 1024),
+        max_workers=int(os.environ.get("INGESTION_WORKERS", "2")),
+        batch_size=int(os.environ.get("INGESTION_BATCH_SIZE", "32")),
+        index_store=app[INDEXES]
+    )
+    app[TURN_EXECUTOR] = ThreadPoolExecutor(
+        max_workers=int(os.environ.get("SERVICE_TURN_THREADS", "16")),
+        thread_name_prefix="chat-turn"
+    )
+    app[DB_EXECUTOR] = ThreadPoolExecutor(
+        max_workers=int(os.environ.get("SERVICE_DB_THREADS", "8")),
+        thread_name_prefix="db-call"
+    )
+    app[BACKGROUND_TASKS] = set()
+
+    async def shutdown_executors(app):
+        app[TURN_EXECUTOR].shutdown(wait=False, cancel_futures=True)
+        app[DB_EXECUTOR].shutdown(wait=False, cancel_futures=True)
+    app.on_cleanup.append(shutdown_executors)
+
+    app.add_routes([
+        web.get("/health", health),
+        web.get("/sessions", list_sessions),
+        web.post("/sessions", create_session),
+        web.get("/sessions/{session_id}/messages", session_messages),
+        web.post("/sessions/{session_id}/documents", upload_document),
+        web.get("/sessions/{session_id}/documents", get_document_status),
+        web.post("/sessions/{session_id}/chat", chat),
+    ])
+    return app
+
+
+def serve(host: str, port: int, reuse_port: bool = False) -> None:
+    from utils.archiver import start_background_archiver
+
+    print(f"Study Buddy service worker {os.getpid()} listening on http://{host}:{port}")
+    start_background_archiver()
+    web.run_app(create_app(), host=host, port=port, reuse_port=reuse_port, print=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless Study Buddy chat service.")
+    parser.add_argument("--host", default=os.environ.get("STUDY_BUDDY_SERVICE_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("STUDY_BUDDY_SERVICE_PORT", "8600")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("STUDY_BUDDY_SERVICE_WORKERS", "1")),
+                        help="Worker processes sharing the port")
+    args = parser.parse_args()
+
+    if args.workers <= 1 or not hasattr(socket, "SO_REUSEPORT"):
+        if args.workers > 1:
+            print("SO_REUSEPORT is not available on this platform, starting a single worker.")
+        serve(args.host, args.port)
+        return
+
+    # Every worker has its own gateway, split the Gemini rate limits between them. Spawned
+    # workers inherit the environment.
+    processes = float(os.environ.get("GEMINI_RPM_PROCESSES", "1")) * args.workers
+    os.environ["GEMINI_RPM_PROCESSES"] = f"{processes:g}"
+
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=serve, args=(args.host, args.port, True), name=f"study-buddy-{i}")
+        for i in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+
+
+if __name__ == "__main__":
+    main()
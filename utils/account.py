@@ -2,7 +2,6 @@ import os
 import streamlit as st
 from utils.database import delete_all_sessions_for_user
 from utils.database import get_unique_users_and_session_counts
-import pandas as pd
 
 st.markdown(
     f"""
@@ -37,12 +36,18 @@ with st.container(border=True):
 with st.expander("Delete All Chat Sessions"):
     if st.button("Clear All Chats"):
         deleted_count = delete_all_sessions_for_user(st.session_state.email)
+        for key in ("session_list_since", "session_list_complete", "pinned_session_id"):
+            st.session_state.pop(key, None)
         st.success(f"Deleted {deleted_count} session(s)")
         
 st.divider()
 st.subheader("Admin Section")
 if st.experimental_user.is_logged_in:
     if st.experimental_user.email == os.environ.get("ADMIN_EMAIL"):
+        import pandas as pd
+        from utils.llm_gateway import get_gateway
+        from utils.metering import get_meter
+
         users = get_unique_users_and_session_counts()
         if users:
             with st.spinner("Loading unique users and session counts..."):
@@ -56,4 +61,49 @@ if st.experimental_user.is_logged_in:
                 st.divider()
                 df = pd.DataFrame(users)
                 df.columns = ["User ID", "Session Count"]
-                st.dataframe(df, use_container_width=True)
\ No newline at end of file
+                st.dataframe(df, use_container_width=True)
+
+        st.divider()
+        st.write("Gemini requests on this server process")
+        gateway_metrics = get_gateway().metrics()
+        if gateway_metrics:
+            st.dataframe(pd.DataFrame(gateway_metrics), use_container_width=True)
+        else:
+            st.info("No Gemini requests yet")
+
+        st.divider()
+        st.subheader("LLM Usage")
+        meter = get_meter()
+        period = st.selectbox("Period", [1, 7, 30], index=2, format_func=lambda days: "Today" if days == 1 else f"Last {days} days")
+        usage_columns = ["calls", "input_tokens", "output_tokens", "cost_usd", "avg_latency_seconds", "max_latency_seconds", "errors"]
+        user_usage = meter.usage_report(days=period)
+        if user_usage:
+            st.metric(label="Total Cost (USD)", value=f"${sum(row['cost_usd'] for row in user_usage):.4f}", border=True)
+            st.dataframe(pd.DataFrame(user_usage)[["user_id"] + usage_columns], use_container_width=True)
+            st.write("By feature and model")
+            feature_usage = meter.usage_report(days=period, group_by=("feature", "model"))
+            st.dataframe(pd.DataFrame(feature_usage)[["feature", "model"] + usage_columns], use_container_width=True)
+        else:
+            st.info("No LLM usage recorded yet")
+
+        default_quota = meter.default_quota
+        st.caption(
+            f"Default daily limits: {default_quota['daily_tokens'] or 'unlimited'} tokens, "
+            f"{'$' + format(default_quota['daily_cost_usd'], '.2f') if default_quota['daily_cost_usd'] else 'unlimited'} per user."
+        )
+        with st.form("user_quota"):
+            quota_user = st.text_input("User email")
+            quota_tokens = st.number_input("Daily token limit (0 for unlimited)", min_value=0, step=10000)
+            quota_cost = st.number_input("Daily cost limit in USD (0 for unlimited)", min_value=0.0, step=0.5)
+            save_col, reset_col = st.columns(2)
+            save_quota = save_col.form_submit_button("Save quota")
+            reset_quota = reset_col.form_submit_button("Reset to default")
+        if quota_user.strip() and save_quota:
+            meter.set_quota(quota_user.strip(), daily_tokens=int(quota_tokens) or None, daily_cost_usd=float(quota_cost) or None)
+            st.success(f"Saved the daily quota of {quota_user.strip()}")
+        elif quota_user.strip() and reset_quota:
+            meter.remove_quota(quota_user.strip())
+            st.success(f"{quota_user.strip()} now has the default daily quota")
+        if quota_user.strip():
+            used = meter.usage_today(quota_user.strip())
+            st.caption(f"{quota_user.strip()} used {used['tokens']} tokens (${used['cost_usd']:.4f}) today.")
@@ -0,0 +1,64 @@
+"""
+Tiering job moving inactive chat sessions into the compressed archive collection.
+
+Run `python -m utils.archiver --days 30` from cron, or set SESSION_ARCHIVE_AFTER_DAYS and the
+app (and each chat service worker) runs it in the background every
+SESSION_ARCHIVE_INTERVAL_HOURS (default 6). Archived sessions stay in the sidebar and are
+restored as soon as they are opened.
+"""
+import argparse
+import os
+import threading
+import time
+
+
+def archive_after_days():
+    """Returns the configured inactivity period in days, None if archiving is disabled."""
+    value = os.environ.get("SESSION_ARCHIVE_AFTER_DAYS", "").strip()
+    return float(value) if value else None
+
+
+def archive_all(inactive_days: float, limit: int = 500) -> int:
+    """Archives every inactive session, `limit` at a time. Returns how many were archived."""
+    from utils.database import archive_inactive_sessions
+
+    total = 0
+    while True:
+        archived = archive_inactive_sessions(inactive_days, limit=limit)
+        total += archived
+        if archived < limit:
+            return total
+
+
+def start_background_archiver():
+    """Starts the periodic archiving thread if SESSION_ARCHIVE_AFTER_DAYS is set."""
+    inactive_days = archive_after_days()
+    if inactive_days is None:
+        return None
+    interval = float(os.environ.get("SESSION_ARCHIVE_INTERVAL_HOURS", "6")) * 3600
+
+    def loop():
+        while True:
+            try:
+                archived = archive_all(inactive_days)
+                if archived:
+                    print(f"Archived {archived} chat sessions inactive for {inactive_days:g} days.")
+            except Exception as e:
+                print(f"Session archiving failed: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="session-archiver", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Archive chat sessions that have been inactive for a while.")
+    parser.add_argument("--days", type=float, default=archive_after_days() or 30,
+                        help="Days without a new message before a session is archived")
+    parser.add_argument("--limit", type=int, default=500, help="Sessions archived per batch")
+    args = parser.parse_args()
+    print(f"Archived {archive_all(args.days, args.limit)} chat sessions.")
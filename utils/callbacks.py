@@ -0,0 +1,81 @@
+from langchain_core.callbacks.base import BaseCallbackHandler
+
+class StreamlitCallbackHandler(BaseCallbackHandler):
+    def __init__(self, status):
+        self.status = status
+        self.action = None
+
+    def on_agent_action(self, action, **kwargs):
+        self.action = action
+        tool_input = action.tool_input
+        query = "details"
+        tool_name = action.tool
+
+        if isinstance(tool_input, dict):
+            query = tool_input.get("query", tool_input.get("input", str(tool_input)))
+        elif isinstance(tool_input, str):
+             query = tool_input
+
+        if tool_name == "document_search":
+             self.status.update(label=f"Searching document for: `{query}`")
+        elif tool_name == "tavily_search_results_json":
+             self.status.update(label=f"Searching the web for: `{query}`")
+        elif tool_name == "qa_generation":
+             num_pairs = tool_input.get('number', 'some') if isinstance(tool_input, dict) else 'some'
+             self.status.update(label=f"Generating {num_pairs} Q&A pairs...")
+        else:
+             self.status.update(label=f"Using tool `{tool_name}`...")
+
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        tool_name = serialized.get("name", "tool")
+        query = "details"
+        if self.action:
+            tool_input = self.action.tool_input
+            if isinstance(tool_input, dict):
+                query = tool_input.get("query", tool_input.get("input", str(tool_input)))
+            elif isinstance(tool_input, str):
+                query = tool_input
+
+        if tool_name == "document_search":
+            self.status.update(label=f"Processing document search for: `{query}`")
+        elif tool_name == "tavily_search_results_json":
+            self.status.update(label=f"Processing web search for: `{query}`")
+        elif tool_name == "qa_generation":
+            self.status.update(label=f"Processing Q&A generation...")
+        else:
+            self.status.update(label=f"Processing with `{tool_name}`...")
+
+
+    def on_tool_end(self, output, **kwargs):
+        tool_name = self.action.tool if self.action else "tool"
+        if tool_name == "document_search":
+            self.status.update(label="Aggregating document search results")
+        elif tool_name == "tavily_search_results_json":
+            self.status.update(label="Aggregating web search results")
+        elif tool_name == "qa_generation":
+            self.status.update(label="Finalizing Q&A generation")
+        else:
+            self.status.update(label=f"Finished using `{tool_name}`")
+
+
+class EventStatus:
+    """Stands in for `st.status` outside of Streamlit, turning label updates into events."""
+
+    def __init__(self, emit):
+        self.emit = emit
+
+    def update(self, label=None, **kwargs):
+        if label:
+            self.emit({"type": "status", "label": label})
+
+
+class TokenStreamHandler(BaseCallbackHandler):
+    """Forwards the text the agent's LLM streams back as token events."""
+
+    def __init__(self, emit):
+        self.emit = emit
+
+    def on_llm_new_token(self, token, **kwargs):
+        if token:
+            self.emit({"type": "token", "text": token})
@@ -1,9 +1,12 @@
 import streamlit as st
 from pymongo import MongoClient
-from langchain_core.messages import AIMessage, HumanMessage
+from ext_tools.chunker import estimate_tokens
+from utils.messages import to_langchain_messages
 from bson.objectid import ObjectId
+from bson import BSON, Binary
 import datetime
 import os
+import zlib
 
 @st.cache_resource
 def prepare_db_coll(coll_name):
@@ -15,6 +18,15 @@ def prepare_db_coll(coll_name):
 
 message_collection = prepare_db_coll("chat_history")
 feedback_collection = prepare_db_coll("feedbacks")
+# Message arrays of inactive sessions, zlib compressed BSON, see `archive_inactive_sessions`.
+archive_collection = prepare_db_coll("chat_archive")
+
+# Fields moved out of the hot session document when a session is archived.
+ARCHIVED_FIELDS = ("messages", "summary")
+# Age after which an unfinished archiving claim is considered abandoned.
+ARCHIVE_CLAIM_TIMEOUT = datetime.timedelta(hours=1)
+# Sessions per page of the sidebar list and of search results.
+SESSION_PAGE_SIZE = 20
 
 def create_chat_session(user_id: str, session_name: str = "New Chat"):
     """Creates a new chat session with a unique name derived from the base name and session ID."""
@@ -26,6 +38,7 @@ def create_chat_session(user_id: str, session_name: str = "New Chat"):
         "_id": session_id,
         "user_id": user_id,
         "session_name": unique_session_name,
+        "title": base_name,
         "created_at": timestamp,
         "last_updated": timestamp,
         "messages": []
@@ -41,6 +54,7 @@ def update_session_name(session_id: ObjectId, base_session_name: str):
         {
             "$set": {
                 "session_name": unique_session_name,
+                "title": base_name,
                 "last_updated": datetime.datetime.now(datetime.timezone.utc)
              }
         }
@@ -55,31 +69,161 @@ def add_message_to_session(session_id: ObjectId, content: str, kind: str):
         except Exception:
             return
 
+    update = {
+        "$push": {
+            "messages": {
+                "content": content,
+                "kind": kind,
+                "timestamp": datetime.datetime.now(datetime.timezone.utc)
+            }
+        },
+        "$set": {
+             "last_updated": datetime.datetime.now(datetime.timezone.utc)
+        }
+    }
+    result = message_collection.update_one({"_id": session_id, "archived": {"$ne": True}}, update)
+    if result.matched_count == 0 and restore_session(session_id):
+        message_collection.update_one({"_id": session_id, "archived": {"$ne": True}}, update)
+
+def get_session(session_id: ObjectId, user_id: str, projection: dict = None):
+    """Returns a chat session if it belongs to `user_id`, otherwise None."""
+    if not isinstance(session_id, ObjectId):
+        try:
+            session_id = ObjectId(session_id)
+        except Exception:
+            return None
+    if projection:
+        projection = dict(projection, archived=1)
+    session = message_collection.find_one({"_id": session_id, "user_id": user_id}, projection)
+    if session and session.get("archived") and restore_session(session_id):
+        session = message_collection.find_one({"_id": session_id, "user_id": user_id}, projection)
+    return session
+
+def set_session_document(session_id: ObjectId, document: dict, only_if_key: str = None):
+    """
+    Records the document attached to a chat session, so any service worker can find its index.
+    With `only_if_key` the record is only updated while that document is still the attached one.
+    """
+    query = {"_id": session_id}
+    if only_if_key is not None:
+        query["document.key"] = only_if_key
     message_collection.update_one(
-        {"_id": session_id},
+        query,
         {
-            "$push": {
-                "messages": {
-                    "content": content,
-                    "kind": kind,
-                    "timestamp": datetime.datetime.now(datetime.timezone.utc)
-                }
-            },
             "$set": {
-                 "last_updated": datetime.datetime.now(datetime.timezone.utc)
+                "document": document,
+                "last_updated": datetime.datetime.now(datetime.timezone.utc)
             }
         }
     )
 
-def get_chat_sessions(user_id: str):
-    """Fetches all chat sessions for a user, returning (id, unique_session_name) tuples."""
+def create_session_indexes():
+    """
+    Creates the indexes behind the session list and chat search.
+
+    The text index is prefixed with `user_id`, every search is an equality match on the
+    user first and only walks that user's entries. It covers the plain `title`, the text
+    tokenizer does not split `session_name` ("<title>_<id>") on the underscore.
+    """
+    message_collection.create_index([("user_id", 1), ("created_at", -1), ("_id", -1)])
+    message_collection.create_index(
+        [("user_id", 1), ("title", "text"), ("messages.content", "text")],
+        weights={"title": 5, "messages.content": 1},
+        name="session_title_text_search"
+    )
+
+def session_title(session_name: str, session_id) -> str:
+    """Base title of a unique session name ("<title>_<session id>")."""
+    suffix = f"_{session_id}"
+    return session_name[:-len(suffix)] if session_name.endswith(suffix) else session_name
+
+def backfill_session_titles(batch_size: int = 500) -> int:
+    """Sets `title` on sessions created before it was stored. Returns how many were updated."""
+    from pymongo import UpdateOne
+
+    updated = 0
+    batch = []
+    for session in message_collection.find({"title": {"$exists": False}}, {"session_name": 1}):
+        title = session_title(session.get("session_name", ""), session["_id"])
+        batch.append(UpdateOne({"_id": session["_id"]}, {"$set": {"title": title}}))
+        if len(batch) >= batch_size:
+            updated += message_collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += message_collection.bulk_write(batch, ordered=False).modified_count
+    return updated
+
+def session_cursor(session: dict) -> str:
+    """Position of a session in the newest first session list, as an opaque string."""
+    created_at = session["created_at"].replace(tzinfo=None)
+    return f"{created_at.isoformat()}_{session['_id']}"
+
+def _cursor_query(cursor: str, inclusive: bool, older: bool) -> dict:
+    created_at, _, session_id = cursor.rpartition("_")
+    created_at = datetime.datetime.fromisoformat(created_at)
+    session_id = ObjectId(session_id)
+    strict = "$lt" if older else "$gt"
+    tie = ("$lte" if older else "$gte") if inclusive else strict
+    return {"$or": [
+        {"created_at": {strict: created_at}},
+        {"created_at": created_at, "_id": {tie: session_id}}
+    ]}
+
+def get_chat_sessions_page(user_id: str, before: str = None, since: str = None, limit: int = SESSION_PAGE_SIZE):
+    """
+    Fetches one page of a user's chat sessions, newest first.
+
+    Pages are ranges of the (created_at, _id) index, so a page costs the same however many
+    sessions the user has.
+
+    Args:
+        user_id (str): Owner of the sessions.
+        before (str): Cursor of the last session of the previous page, only older sessions are returned.
+        since (str): Cursor of the oldest session to include, every newer session is returned.
+        limit (int): Most sessions returned, None for the whole `since` range.
+
+    Returns:
+        tuple: (id, unique_session_name) tuples and the cursor of the next page, None on the last page.
+    """
+    query = {"user_id": user_id}
+    ranges = []
+    if before:
+        ranges.append(_cursor_query(before, inclusive=False, older=True))
+    if since:
+        ranges.append(_cursor_query(since, inclusive=True, older=False))
+    if ranges:
+        query["$and"] = ranges
     sessions = message_collection.find(
-        {"user_id": user_id},
-        {"_id": 1, "session_name": 1}
-    ).sort("created_at", -1)
-    for session in sessions:
-        unique_name = session.get("session_name", f"Chat_{session['_id']}")
-        yield (session["_id"], unique_name)
+        query,
+        {"_id": 1, "session_name": 1, "created_at": 1}
+    ).sort([("created_at", -1), ("_id", -1)])
+    if limit:
+        sessions = list(sessions.limit(limit + 1))
+        has_more = len(sessions) > limit
+        sessions = sessions[:limit]
+    else:
+        sessions = list(sessions)
+        has_more = bool(since) and message_collection.find_one(
+            {"user_id": user_id, **_cursor_query(since, inclusive=False, older=True)}, {"_id": 1}
+        ) is not None
+    next_cursor = session_cursor(sessions[-1]) if has_more and sessions else None
+    return [(session["_id"], session.get("session_name", f"Chat_{session['_id']}")) for session in sessions], next_cursor
+
+def search_chat_sessions(user_id: str, text: str, limit: int = SESSION_PAGE_SIZE):
+    """
+    Full-text search over a user's session titles and messages, best matches first.
+
+    Archived sessions only keep their title in the hot collection, so they are found by
+    title until they are reopened.
+
+    Returns:
+        list: (id, unique_session_name) tuples.
+    """
+    sessions = message_collection.find(
+        {"user_id": user_id, "$text": {"$search": text}},
+        {"_id": 1, "session_name": 1, "score": {"$meta": "textScore"}}
+    ).sort([("score", {"$meta": "textScore"})]).limit(limit)
+    return [(session["_id"], session.get("session_name", f"Chat_{session['_id']}")) for session in sessions]
 
 def prepare_chat_history(session_id: ObjectId, chat_history_limit: int):
     """Fetches messages from a specific session identified by its ObjectId."""
@@ -89,31 +233,207 @@ def prepare_chat_history(session_id: ObjectId, chat_history_limit: int):
         except Exception:
             return []
 
-    session = message_collection.find_one({"_id": session_id})
+    session = find_hot_session(session_id)
     chat_history = []
 
     if session:
         messages = session.get("messages", [])
         start_index = max(0, len(messages) - chat_history_limit)
-        relevant_messages = messages[start_index:]
-
-        for msg in relevant_messages:
-            kind = msg.get("kind")
-            content = msg.get("content", "")
-            if kind == "user":
-                chat_history.append(HumanMessage(content=content))
-            elif kind == "ai":
-                chat_history.append(AIMessage(content=content))
+        chat_history = to_langchain_messages(messages[start_index:])
 
     return chat_history
 
+def prepare_agent_history(session_id: ObjectId, token_budget: int, summarize) -> tuple:
+    """
+    Builds a bounded chat history for the agent: a rolling summary plus the latest messages.
+
+    Messages not yet covered by the session summary are sent as they are while they fit in
+    `token_budget`. Once they go over it, the oldest ones are folded into the summary with
+    `summarize(previous_summary, messages)` until the rest fits in half the budget, and the
+    new summary is stored on the session so the next turns only pay for the remainder.
+
+    Args:
+        session_id (ObjectId): The chat session.
+        token_budget (int): Token budget for the messages sent alongside the summary.
+        summarize (callable): Returns the updated summary text for a list of LangChain messages.
+
+    Returns:
+        tuple: The summary text, empty if nothing was folded yet, and the recent messages.
+    """
+    if not isinstance(session_id, ObjectId):
+        try:
+            session_id = ObjectId(session_id)
+        except Exception:
+            return "", []
+
+    session = find_hot_session(session_id, {"messages": 1, "summary": 1})
+    if not session:
+        return "", []
+
+    messages = session.get("messages", [])
+    summary = session.get("summary") or {}
+    summary_text = summary.get("text", "")
+    summarized_upto = summary.get("upto", 0)
+    window = messages[summarized_upto:]
+
+    window_tokens = [estimate_tokens(msg.get("content", "")) for msg in window]
+    if sum(window_tokens) > token_budget:
+        keep = 0
+        kept_tokens = 0
+        for tokens in reversed(window_tokens):
+            if keep and kept_tokens + tokens > token_budget // 2:
+                break
+            keep += 1
+            kept_tokens += tokens
+        folded = window[:len(window) - keep]
+        # A single message over the budget is kept as it is, there is nothing to fold.
+        if folded:
+            try:
+                summary_text = summarize(summary_text, to_langchain_messages(folded))
+                message_collection.update_one(
+                    {"_id": session_id, "summary.upto": summary.get("upto")},
+                    {
+                        "$set": {
+                            "summary": {
+                                "text": summary_text,
+                                "upto": summarized_upto + len(folded),
+                                "updated_at": datetime.datetime.now(datetime.timezone.utc)
+                            }
+                        }
+                    }
+                )
+            except Exception as e:
+                print(f"Failed to update the summary of session {session_id}: {e}")
+            window = window[len(window) - keep:]
+
+    return summary_text, to_langchain_messages(window)
+
 def delete_all_sessions_for_user(user_id: str):
     """
     Deletes all chat sessions associated with a given user ID.
     """
     result = message_collection.delete_many({"user_id": user_id})
+    archive_collection.delete_many({"user_id": user_id})
     return result.deleted_count
 
+def find_hot_session(session_id: ObjectId, projection: dict = None):
+    """Fetches a session, restoring its messages first if it was archived."""
+    if projection:
+        projection = dict(projection, archived=1)
+    session = message_collection.find_one({"_id": session_id}, projection)
+    if session and session.get("archived") and restore_session(session_id):
+        session = message_collection.find_one({"_id": session_id}, projection)
+    return session
+
+def archive_session(session: dict) -> bool:
+    """
+    Moves the messages and summary of a session into the compressed archive.
+
+    The session document keeps its name, owner and timestamps, so the sidebar listing is
+    unchanged. Several processes run the archiver, so the session is first claimed with an
+    `archiving` token, only the claiming call writes the archive and it only ever deletes
+    the archive it wrote. The move only happens if the session was not updated since
+    `session` was read, a message arriving meanwhile keeps the session hot.
+
+    Returns:
+        bool: True if the session was archived.
+    """
+    token = ObjectId()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    claimed = message_collection.find_one_and_update(
+        {
+            "_id": session["_id"],
+            "last_updated": session.get("last_updated"),
+            "archived": {"$ne": True},
+            # A claim left by a crashed process can be taken over after an hour.
+            "$or": [
+                {"archiving": {"$exists": False}},
+                {"archiving": {"$lt": ObjectId.from_datetime(now - ARCHIVE_CLAIM_TIMEOUT)}}
+            ]
+        },
+        {"$set": {"archiving": token}}
+    )
+    if claimed is None:
+        return False
+
+    payload = {field: claimed[field] for field in ARCHIVED_FIELDS if field in claimed}
+    archive_collection.replace_one(
+        {"_id": session["_id"]},
+        {
+            "_id": session["_id"],
+            "user_id": claimed.get("user_id"),
+            "archive_token": token,
+            "archived_at": now,
+            "message_count": len(claimed.get("messages", [])),
+            "data": Binary(zlib.compress(BSON.encode(payload), 6))
+        },
+        upsert=True
+    )
+    result = message_collection.update_one(
+        {"_id": session["_id"], "archiving": token, "last_updated": claimed.get("last_updated")},
+        {
+            "$set": {"archived": True, "archive_token": token},
+            "$unset": {"archiving": "", **{field: "" for field in ARCHIVED_FIELDS}}
+        }
+    )
+    if result.modified_count == 0:
+        archive_collection.delete_one({"_id": session["_id"], "archive_token": token})
+        message_collection.update_one({"_id": session["_id"], "archiving": token}, {"$unset": {"archiving": ""}})
+        return False
+    return True
+
+def restore_session(session_id: ObjectId) -> bool:
+    """
+    Moves an archived session's messages back into the hot collection.
+
+    Both the restore and the removal of the archive are conditional on the archive that
+    was read, an archive written meanwhile by another process is never lost. The session
+    counts as updated now, so it is not archived again right after being opened.
+
+    Returns:
+        bool: True if the session is hot afterwards (restored here or by a concurrent call).
+    """
+    archived = archive_collection.find_one({"_id": session_id})
+    if archived is not None:
+        token = archived["archive_token"]
+        payload = BSON(zlib.decompress(archived["data"])).decode()
+        payload.setdefault("messages", [])
+        payload["last_updated"] = datetime.datetime.now(datetime.timezone.utc)
+        result = message_collection.update_one(
+            {"_id": session_id, "archived": True, "archive_token": token},
+            {"$set": payload, "$unset": {"archived": "", "archive_token": ""}}
+        )
+        if result.modified_count:
+            archive_collection.delete_one({"_id": session_id, "archive_token": token})
+            return True
+    session = message_collection.find_one({"_id": session_id}, {"archived": 1})
+    return bool(session) and not session.get("archived")
+
+def archive_inactive_sessions(inactive_days: float, limit: int = 500) -> int:
+    """
+    Archives sessions that have not been updated for `inactive_days`.
+
+    Args:
+        inactive_days (float): Days without a new message before a session is archived.
+        limit (int): Most sessions archived in one call.
+
+    Returns:
+        int: The number of sessions archived.
+    """
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=inactive_days)
+    message_collection.create_index([("archived", 1), ("last_updated", 1)])
+    sessions = message_collection.find(
+        {"archived": {"$ne": True}, "last_updated": {"$lt": cutoff}}
+    ).limit(limit)
+    archived = 0
+    for session in sessions:
+        try:
+            if archive_session(session):
+                archived += 1
+        except Exception as e:
+            print(f"Failed to archive session {session['_id']}: {e}")
+    return archived
+
 # function to get all unique users and their session counts
 def get_unique_users_and_session_counts():
     pipeline = [
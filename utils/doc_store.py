@@ -0,0 +1,122 @@
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
+
+def content_key(file_content: bytes) -> str:
+    """Key of a document in the store: the sha256 of the uploaded bytes."""
+    return hashlib.sha256(file_content).hexdigest()
+
+
+class DocumentHandle:
+    """
+    Read-only reference to a shared store entry held by one user session.
+
+    The reference is released by `release()` or, if the session simply goes away, when the
+    handle is garbage collected.
+    """
+
+    def __init__(self, store: "DocumentStore", key: str, entry) -> None:
+        self.key = key
+        self.entry = entry
+        self._finalizer = weakref.finalize(self, store._release, key, entry)
+
+    def release(self) -> None:
+        """Gives the reference back to the store, calling it more than once is harmless."""
+        self._finalizer()
+
+    @property
+    def released(self) -> bool:
+        return not self._finalizer.alive
+
+
+class DocumentStore:
+    """
+    Process-wide store of parsed documents and their indexes, keyed by content hash.
+
+    Entries are reference counted through `DocumentHandle`s. Once the total size of the
+    entries goes over `max_bytes`, unreferenced entries are evicted, least recently used
+    first. Entries must expose a `size_bytes` attribute and an `active` flag, active entries
+    are never evicted.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._refcounts = {}
+        self._lock = threading.RLock()
+        self.evictions = 0
+
+    def acquire(self, key: str):
+        """Returns a new handle on `key`, or None if the document is not in the store."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self._refcounts[key] += 1
+        return DocumentHandle(self, key, entry)
+
+    def get_or_create(self, key: str, factory):
+        """
+        Returns `(handle, created)` for `key`, building the entry with `factory()` if missing.
+
+        The factory is called under the store lock so concurrent uploads of the same file
+        share a single entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            created = entry is None
+            if created:
+                entry = factory()
+                self._entries[key] = entry
+                self._refcounts[key] = 0
+            self._entries.move_to_end(key)
+            self._refcounts[key] += 1
+        handle = DocumentHandle(self, key, entry)
+        if created:
+            self.evict()
+        return handle, created
+
+    def discard(self, key: str, entry) -> None:
+        """Removes `entry` from the store (e.g. a failed ingestion) so the next upload rebuilds it."""
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+                del self._refcounts[key]
+
+    def _release(self, key: str, entry) -> None:
+        # Also runs from garbage collection, so it only drops the count and leaves eviction
+        # to the next `get_or_create()` or `evict()` call.
+        with self._lock:
+            if self._entries.get(key) is entry:
+                self._refcounts[key] = max(0, self._refcounts[key] - 1)
+
+    def evict(self) -> int:
+        """Evicts unreferenced entries until the store fits in its byte budget, returns how many."""
+        evicted = 0
+        with self._lock:
+            total = sum(entry.size_bytes for entry in self._entries.values())
+            for key in list(self._entries):
+                if total <= self.max_bytes:
+                    break
+                entry = self._entries[key]
+                if self._refcounts[key] > 0 or entry.active:
+                    continue
+                total -= entry.size_bytes
+                del self._entries[key]
+                del self._refcounts[key]
+                evicted += 1
+            self.evictions += evicted
+        return evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "documents": len(self._entries),
+                "references": sum(self._refcounts.values()),
+                "bytes": sum(entry.size_bytes for entry in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
@@ -1,5 +1,4 @@
 import streamlit as st
-import pandas as pd
 from utils.database import feedback_collection
 from dotenv import load_dotenv; load_dotenv()
 
@@ -62,6 +61,7 @@ else:
         st.write("Admin section for all feedbacks")
         
         with st.spinner("Loading feedbacks"):
+            import pandas as pd
             all_feedbacks = feedback_collection.find()
             df = pd.DataFrame(list(all_feedbacks))
             if not df.empty:
@@ -0,0 +1,110 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+from ext_tools.chunker import ParentWindows
+from utils.llm_gateway import gemini_client_kwargs
+
+
+class LoadedIndex:
+    """A document index read back from disk, with what the document tools need."""
+
+    def __init__(self, key: str, meta: dict, vectorstore, embedding, docs: tuple) -> None:
+        self.key = key
+        self.meta = meta
+        self.vectorstore = vectorstore
+        self.embedding = embedding
+        self.docs = docs
+        self.windows = ParentWindows(docs)
+        self.lock = threading.Lock()
+
+    def tools(self, downloads: list) -> list:
+        """Returns the document tools, generated Q&A CSVs are appended to `downloads`."""
+        from ext_tools.instant_rag import make_retrieval_tool
+        from ext_tools.qa_tool import make_qa_tool
+
+        return [make_retrieval_tool(self.vectorstore, self.embedding, self.lock, self.windows), make_qa_tool(self.docs, downloads)]
+
+
+class IndexStore:
+    """
+    Finished document indexes saved on disk, keyed by content hash.
+
+    Every service worker process reads the same directory, so a document indexed by one
+    worker is searchable from all of them (and from other nodes sharing the directory).
+    Each index is written to a temporary directory and renamed into place, readers never
+    see half written files. Indexes read back are kept in a small per-process LRU.
+    """
+
+    def __init__(self, root: str, max_loaded: int = 32) -> None:
+        self.root = root
+        self.max_loaded = max_loaded
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.path(key), "meta.json"))
+
+    def meta(self, key: str):
+        """Returns the saved status of an index, or None if it is not on disk."""
+        try:
+            with open(os.path.join(self.path(key), "meta.json")) as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, job, embeddings_model_name: str) -> None:
+        """Writes the index, the deduplicated document lines and the job status of a finished job."""
+        if self.exists(job.key):
+            return
+        tmp_dir = tempfile.mkdtemp(prefix=f".{job.key[:12]}-", dir=self.root)
+        try:
+            with job.index_lock:
+                job.vectorstore.save_local(tmp_dir)
+            with open(os.path.join(tmp_dir, "docs.json"), "w") as docs_file:
+                json.dump([[doc.page_content, doc.metadata] for doc in job.docs], docs_file)
+            meta = dict(job.snapshot(), embeddings_model=embeddings_model_name)
+            with open(os.path.join(tmp_dir, "meta.json"), "w") as meta_file:
+                json.dump(meta, meta_file)
+            os.replace(tmp_dir, self.path(job.key))
+        except OSError:
+            # Another worker saved the same document first.
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not self.exists(job.key):
+                raise
+
+    def load(self, key: str):
+        """Returns the `LoadedIndex` for a document, or None if it is not on disk."""
+        with self._lock:
+            loaded = self._loaded.get(key)
+            if loaded is not None:
+                self._loaded.move_to_end(key)
+                return loaded
+
+        meta = self.meta(key)
+        if meta is None:
+            return None
+        from langchain_core.documents import Document
+        from langchain_community.vectorstores import FAISS
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        embedding = GoogleGenerativeAIEmbeddings(model=meta["embeddings_model"], **gemini_client_kwargs())
+        # The pickled docstore was written by `save()` above, never by a client.
+        vectorstore = FAISS.load_local(self.path(key), embedding, allow_dangerous_deserialization=True)
+        with open(os.path.join(self.path(key), "docs.json")) as docs_file:
+            docs = tuple(Document(page_content=text, metadata=metadata) for text, metadata in json.load(docs_file))
+
+        loaded = LoadedIndex(key, meta, vectorstore, embedding, docs)
+        with self._lock:
+            loaded = self._loaded.setdefault(key, loaded)
+            self._loaded.move_to_end(key)
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+        return loaded
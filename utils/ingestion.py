@@ -0,0 +1,248 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+
+from ext_tools.loader import LambdaStreamlitLoader, InMemoryFile
+from ext_tools.chunker import chunk_documents, ParentWindows
+from ext_tools.dedup import remove_boilerplate
+from utils.doc_store import DocumentStore, content_key
+from utils.llm_gateway import gemini_client_kwargs
+
+# Share of the progress bar given to each stage, the rest goes to indexing.
+LOADING_SHARE = 0.2
+DEDUP_SHARE = 0.03
+CHUNKING_SHARE = 0.02
+# Chunks are only used to match, the search returns the section around them.
+CHUNK_TOKENS = 200
+
+
+class IngestionJob:
+    """
+    State of one uploaded file going through loading, deduplication, chunking and indexing.
+
+    Jobs are keyed by the content hash of the file and live in the shared `DocumentStore`,
+    so every session that uploads the same bytes reads the same parsed text and index.
+    The job is written by a worker thread and read by the Streamlit scripts, every read of
+    several fields at once should go through `snapshot()`.
+    """
+
+    def __init__(self, key: str, file_name: str, file_content: bytes) -> None:
+        self.id = key
+        self.key = key
+        self.file_name = file_name
+        self.file_content = file_content
+        self.created_at = time.time()
+        self.finished_at = None
+
+        self.state = "queued"
+        self.stage = "queued"
+        self.progress = 0.0
+        self.pages_total = None
+        self.pages_indexed = 0
+        self.chunks_total = 0
+        self.chunks_indexed = 0
+        self.warnings = []
+        self.error = None
+        self.size_bytes = 0
+        self.dedup_report = None
+
+        self.docs = None
+        self.embedding = None
+        self.vectorstore = None
+        self.windows = None
+        self.index_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def _update(self, **fields):
+        with self._lock:
+            for key, value in fields.items():
+                setattr(self, key, value)
+
+    def snapshot(self) -> dict:
+        """Returns a consistent copy of the job status fields."""
+        with self._lock:
+            return {
+                "id": self.id,
+                "file_name": self.file_name,
+                "state": self.state,
+                "stage": self.stage,
+                "progress": self.progress,
+                "pages_total": self.pages_total,
+                "pages_indexed": self.pages_indexed,
+                "chunks_total": self.chunks_total,
+                "chunks_indexed": self.chunks_indexed,
+                "warnings": list(self.warnings),
+                "error": self.error,
+                "dedup_report": self.dedup_report,
+                "searchable": self.vectorstore is not None,
+            }
+
+    @property
+    def active(self) -> bool:
+        return self.state in ("queued", "running")
+
+    def tools(self, downloads: list = None) -> list:
+        """
+        Returns the document tools available so far (empty until the first pages are indexed).
+
+        Without `downloads` the Q&A tool works on the Streamlit session, otherwise it is bound
+        to this document and appends the CSVs it generates to `downloads`.
+        """
+        from ext_tools.instant_rag import make_retrieval_tool
+        from ext_tools.qa_tool import qa_generation, make_qa_tool
+
+        with self._lock:
+            vectorstore = self.vectorstore
+            docs = self.docs
+            windows = self.windows
+        if vectorstore is None:
+            return []
+        qa_tool = qa_generation if downloads is None else make_qa_tool(docs, downloads)
+        return [make_retrieval_tool(vectorstore, self.embedding, self.index_lock, windows), qa_tool]
+
+    def run(self, batch_size: int, embeddings_model_name: str) -> None:
+        """Runs every stage of the job, recording failures on the job instead of raising."""
+        try:
+            self._update(state="running", stage="loading")
+            self._load()
+            if not self.docs:
+                self._update(state="failed", stage="done", error=f"Could not extract content from '{self.file_name}'.")
+                return
+
+            self._update(stage="deduplicating", progress=LOADING_SHARE)
+            docs, dedup_report = remove_boilerplate(self.docs)
+            if dedup_report["lines_dropped"]:
+                print(f"Ingestion job {self.id[:12]} dropped {dedup_report['lines_dropped']} repeated lines (~{dedup_report['tokens_saved']} tokens).")
+            self._update(
+                docs=tuple(docs),
+                dedup_report=dedup_report,
+                size_bytes=sum(len(doc.page_content) for doc in docs)
+            )
+
+            self._update(stage="chunking", progress=LOADING_SHARE + DEDUP_SHARE)
+            chunks = chunk_documents(self.docs, max_tokens=CHUNK_TOKENS)
+            if not chunks:
+                self._update(state="failed", stage="done", error="Document content was empty after chunking.")
+                return
+            self._update(windows=ParentWindows(self.docs))
+            self._update(stage="indexing", chunks_total=len(chunks), progress=LOADING_SHARE + DEDUP_SHARE + CHUNKING_SHARE)
+
+            self._index(chunks, batch_size, embeddings_model_name)
+            self._update(state="done", stage="done", progress=1.0)
+            print(f"Ingestion job {self.id[:12]} indexed {len(self.docs)} lines in {len(chunks)} chunks.")
+        except Exception as e:
+            print(f"Ingestion job {self.id[:12]} failed: {e}")
+            self._update(state="failed", stage="done", error=str(e))
+        finally:
+            self.file_content = None
+            self._update(finished_at=time.time())
+
+    def _load(self):
+        loader = LambdaStreamlitLoader(InMemoryFile(self.file_name, self.file_content))
+        docs = []
+        last_page = 0
+        for doc in loader.lazy_load():
+            docs.append(doc)
+            page = doc.metadata.get("page")
+            if page and page != last_page and loader.total_pages:
+                last_page = page
+                self._update(
+                    pages_total=loader.total_pages,
+                    progress=LOADING_SHARE * page / loader.total_pages
+                )
+        self._update(
+            docs=tuple(docs),
+            pages_total=loader.total_pages,
+            warnings=loader.warnings,
+            size_bytes=sum(len(doc.page_content) for doc in docs)
+        )
+
+    def _index(self, chunks, batch_size, embeddings_model_name):
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        from ext_tools.instant_rag import add_chunks_to_index
+
+        self.embedding = GoogleGenerativeAIEmbeddings(model=embeddings_model_name, **gemini_client_kwargs())
+        vectorstore = None
+        start_share = LOADING_SHARE + DEDUP_SHARE + CHUNKING_SHARE
+        docs_bytes = self.size_bytes
+        chunk_bytes = 0
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start:start + batch_size]
+            vectorstore = add_chunks_to_index(vectorstore, batch, self.embedding, self.index_lock)
+            indexed = start + len(batch)
+            last_meta = batch[-1].metadata
+            chunk_bytes += sum(len(chunk.page_content) for chunk in batch)
+            self._update(
+                size_bytes=docs_bytes + chunk_bytes + vectorstore.index.ntotal * vectorstore.index.d * 4,
+                vectorstore=vectorstore,
+                chunks_indexed=indexed,
+                pages_indexed=last_meta.get("page_end", last_meta.get("page", 0)) or 0,
+                progress=start_share + (1 - start_share) * indexed / len(chunks),
+            )
+
+
+class IngestionManager:
+    """
+    Process-wide queue of ingestion jobs served by a small worker pool.
+
+    Uploads of a file that is already in the store, or still being ingested for another
+    session, get a handle on the existing job instead of a new one. With an `index_store`,
+    finished indexes are also saved to disk for the other service workers.
+    """
+
+    def __init__(self, store: DocumentStore, max_workers: int = 2, batch_size: int = 32,
+                 max_attachments: int = 10000, embeddings_model_name: str = "models/embedding-001",
+                 index_store=None) -> None:
+        self.store = store
+        self.index_store = index_store
+        self.batch_size = batch_size
+        self.max_attachments = max_attachments
+        self.embeddings_model_name = embeddings_model_name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingestion")
+        self._attachments = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, owner: str, session_id, file_name: str, file_content: bytes):
+        """Returns a `DocumentHandle` on the job for an uploaded file, queueing it if it is new."""
+        key = content_key(file_content)
+        handle, created = self.store.get_or_create(key, lambda: IngestionJob(key, file_name, file_content))
+        if created:
+            self._executor.submit(self._run, handle.entry)
+        with self._lock:
+            self._attachments[(owner, str(session_id))] = key
+            self._attachments.move_to_end((owner, str(session_id)))
+            while len(self._attachments) > self.max_attachments:
+                self._attachments.popitem(last=False)
+        return handle
+
+    def attach(self, owner: str, session_id):
+        """Returns a new handle on the document last uploaded to a chat, used after a refresh."""
+        with self._lock:
+            key = self._attachments.get((owner, str(session_id)))
+        if key is None:
+            return None
+        return self.store.acquire(key)
+
+    def _run(self, job: IngestionJob):
+        job.run(self.batch_size, self.embeddings_model_name)
+        if job.state == "done" and self.index_store is not None:
+            try:
+                self.index_store.save(job, self.embeddings_model_name)
+            except Exception as e:
+                print(f"Ingestion job {job.id[:12]} could not be saved to disk: {e}")
+        if job.state == "failed":
+            self.store.discard(job.key, job)
+        self.store.evict()
+
+
+@st.cache_resource
+def get_ingestion_manager() -> IngestionManager:
+    store = DocumentStore(max_bytes=int(os.environ.get("DOCUMENT_STORE_MAX_MB", "512")) * 1024 * 1024)
+    return IngestionManager(
+        store=store,
+        max_workers=int(os.environ.get("INGESTION_WORKERS", "2")),
+        batch_size=int(os.environ.get("INGESTION_BATCH_SIZE", "32")),
+    )
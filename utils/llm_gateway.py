@@ -0,0 +1,263 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from langchain_core.rate_limiters import BaseRateLimiter
+
+# Lower values are served first when several calls wait on the same model.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_TITLE = 1
+PRIORITY_BATCH = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_TITLE: "title",
+    PRIORITY_BATCH: "batch",
+}
+
+
+def parse_rpm_limits(value: str) -> dict:
+    """Parses "model=rpm,model=rpm" into a dict, ignoring malformed entries."""
+    limits = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        model, rpm = item.split("=", 1)
+        try:
+            limits[model.strip()] = float(rpm)
+        except ValueError:
+            continue
+    return limits
+
+
+def gemini_client_kwargs() -> dict:
+    """
+    Extra client arguments pointing the Gemini clients at GEMINI_API_ENDPOINT when it is set.
+
+    Used for proxies and for the local fake services of the load test, which speak REST.
+    """
+    endpoint = os.environ.get("GEMINI_API_ENDPOINT")
+    if not endpoint:
+        return {}
+    return {"client_options": {"api_endpoint": endpoint}, "transport": "rest"}
+
+
+class PriorityTokenBucket:
+    """
+    Token bucket shared by every caller of one model.
+
+    Waiting callers are served strictly by (priority, arrival order), so a queued
+    interactive turn always gets the next token before queued Q&A or title calls.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int) -> None:
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    @property
+    def queued(self) -> int:
+        with self._condition:
+            return len(self._waiters)
+
+    def acquire(self, priority: int, timeout: float = None) -> bool:
+        """Takes one token, waiting behind higher priority callers. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, ticket)
+            while True:
+                self._refill()
+                if self._waiters[0] == ticket and self.tokens >= 1:
+                    self.tokens -= 1
+                    heapq.heappop(self._waiters)
+                    self._condition.notify_all()
+                    return True
+
+                wait = (1 - self.tokens) / self.rate if self._waiters[0] == ticket else None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._waiters.remove(ticket)
+                        heapq.heapify(self._waiters)
+                        self._condition.notify_all()
+                        return False
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._condition.wait(timeout=wait)
+
+
+class GatewayRateLimiter(BaseRateLimiter):
+    """LangChain rate limiter drawing from the gateway bucket of a model at a fixed priority."""
+
+    def __init__(self, gateway: "LLMGateway", model: str, priority: int) -> None:
+        self.gateway = gateway
+        self.model = model
+        self.priority = priority
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        return self.gateway.acquire(self.model, self.priority, timeout=None if blocking else 0)
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        return await asyncio.to_thread(self.acquire, blocking=blocking)
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class LLMGateway:
+    """
+    Process-wide entry point for Gemini calls.
+
+    Every model gets a `PriorityTokenBucket` sized from `limits` (requests per minute), so
+    bursts from many sessions queue instead of failing with 429s. Identical concurrent
+    requests can be collapsed with `single_flight()`, and `metrics()` reports queueing.
+    """
+
+    def __init__(self, limits: dict = None, default_rpm: float = 60) -> None:
+        self.limits = limits or {}
+        self.default_rpm = default_rpm
+        self._buckets = {}
+        self._flights = {}
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, model: str) -> PriorityTokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(model)
+            if bucket is None:
+                rpm = self.limits.get(model, self.default_rpm)
+                bucket = PriorityTokenBucket(rpm, burst=max(1, int(rpm // 6)))
+                self._buckets[model] = bucket
+            return bucket
+
+    def _record(self, model: str, priority: int, **increments):
+        with self._lock:
+            key = (model, PRIORITY_NAMES.get(priority, str(priority)))
+            stats = self._metrics.setdefault(key, {
+                "requests": 0, "timeouts": 0, "deduplicated": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0
+            })
+            for name, value in increments.items():
+                if name == "max_wait_seconds":
+                    stats[name] = max(stats[name], value)
+                else:
+                    stats[name] += value
+
+    def acquire(self, model: str, priority: int, timeout: float = None) -> bool:
+        """Blocks until a request to `model` is allowed, returns False if `timeout` ran out first."""
+        start = time.monotonic()
+        acquired = self._bucket(model).acquire(priority, timeout=timeout)
+        waited = time.monotonic() - start
+        if acquired:
+            self._record(model, priority, requests=1, wait_seconds=waited, max_wait_seconds=waited)
+        else:
+            self._record(model, priority, timeouts=1)
+        return acquired
+
+    def rate_limiter(self, model: str, priority: int) -> GatewayRateLimiter:
+        return GatewayRateLimiter(self, model, priority)
+
+    def chat_model(self, model: str, priority: int, **kwargs):
+        """Returns a ChatGoogleGenerativeAI whose every request goes through the gateway limiter and is metered."""
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        from utils.metering import get_meter
+
+        callbacks = list(kwargs.pop("callbacks", None) or []) + [get_meter().callback(model)]
+        return ChatGoogleGenerativeAI(
+            model=model, rate_limiter=self.rate_limiter(model, priority), callbacks=callbacks,
+            **gemini_client_kwargs(), **kwargs
+        )
+
+    def single_flight(self, key, fn, model: str = None, priority: int = None):
+        """
+        Runs `fn()` once for concurrent callers sharing `key` and returns its result to all.
+
+        Callers arriving while the first one is still running wait for it instead of
+        sending the same request again. Exceptions are shared the same way.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+
+        if not leader:
+            if model is not None:
+                self._record(model, priority, deduplicated=1)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def run(self, model: str, priority: int, fn, dedup_key=None):
+        """Runs `fn()` after taking a token for `model`, for clients without a `rate_limiter` hook."""
+        def limited():
+            self.acquire(model, priority)
+            return fn()
+
+        if dedup_key is None:
+            return limited()
+        return self.single_flight((model, dedup_key), limited, model=model, priority=priority)
+
+    def metrics(self) -> list:
+        """Returns one row of counters per (model, priority), with the current queue length."""
+        with self._lock:
+            rows = [
+                {"model": model, "priority": priority, **stats}
+                for (model, priority), stats in sorted(self._metrics.items())
+            ]
+            buckets = dict(self._buckets)
+        for row in rows:
+            bucket = buckets.get(row["model"])
+            row["queued_now"] = bucket.queued if bucket else 0
+        return rows
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """
+    Returns the process-wide gateway, configured from GEMINI_RPM_LIMITS and GEMINI_DEFAULT_RPM.
+
+    The limits are for the whole API key, each process gets its share of them when
+    GEMINI_RPM_PROCESSES says how many processes use the key (the chat service sets it
+    for its workers).
+    """
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            processes = max(1.0, float(os.environ.get("GEMINI_RPM_PROCESSES", "1")))
+            limits = parse_rpm_limits(os.environ.get("GEMINI_RPM_LIMITS", ""))
+            _gateway = LLMGateway(
+                limits={model: rpm / processes for model, rpm in limits.items()},
+                default_rpm=float(os.environ.get("GEMINI_DEFAULT_RPM", "60")) / processes,
+            )
+        return _gateway
@@ -0,0 +1,13 @@
+def to_langchain_messages(messages: list) -> list:
+    """Converts stored message dicts into HumanMessage/AIMessage objects."""
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    chat_history = []
+    for msg in messages:
+        kind = msg.get("kind")
+        content = msg.get("content", "")
+        if kind == "user":
+            chat_history.append(HumanMessage(content=content))
+        elif kind == "ai":
+            chat_history.append(AIMessage(content=content))
+    return chat_history
@@ -0,0 +1,373 @@
+"""
+Per-user token and cost metering for every Gemini call, with daily quotas.
+
+Calls are attributed through `metering_context(user_id=..., session_id=..., feature=...)`,
+which the chat turn, title, summary and Q&A paths set around their LLM calls. A callback
+attached to each LLM client records input/output tokens and latency, and checks the user's
+quota before the request is sent. Counters are aggregated in memory and written to MongoDB
+in batches.
+"""
+import atexit
+import contextlib
+import contextvars
+import datetime
+import os
+import threading
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+from ext_tools.chunker import estimate_tokens
+
+# USD per million input and output tokens, override with GEMINI_PRICES="model=input/output,...".
+DEFAULT_PRICES = {
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-1.5-flash": (0.075, 0.30),
+}
+
+COUNTERS = ("calls", "errors", "input_tokens", "output_tokens", "cost_usd", "latency_seconds")
+
+_context = contextvars.ContextVar("metering_context", default={})
+
+
+class QuotaExceededError(RuntimeError):
+    pass
+
+
+@contextlib.contextmanager
+def metering_context(**fields):
+    """Attributes the LLM calls made inside the block to a user, session and/or feature."""
+    token = _context.set({**_context.get(), **{k: v for k, v in fields.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def current_context() -> dict:
+    return dict(_context.get())
+
+
+def parse_prices(value: str) -> dict:
+    """Parses "model=input/output,..." (USD per million tokens) on top of the default prices."""
+    prices = dict(DEFAULT_PRICES)
+    for item in (value or "").split(","):
+        if "=" not in item or "/" not in item:
+            continue
+        model, price = item.split("=", 1)
+        try:
+            input_price, output_price = (float(p) for p in price.split("/", 1))
+        except ValueError:
+            continue
+        prices[model.strip()] = (input_price, output_price)
+    return prices
+
+
+def today() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d")
+
+
+def _usage_of(response, estimated_input: int) -> tuple:
+    """Returns (input_tokens, output_tokens) reported by Gemini, estimated where it reports none."""
+    input_tokens = output_tokens = 0
+    reported = False
+    output_text = ""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                reported = True
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+            output_text += generation.text or ""
+    if not reported:
+        return estimated_input, estimate_tokens(output_text)
+    return input_tokens, output_tokens
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """Records the usage of one model's calls in a `UsageMeter`."""
+
+    # Lets the quota check in `on_*_start` stop the call before it is sent, `check_quota`
+    # only raises `QuotaExceededError`.
+    raise_error = True
+
+    def __init__(self, meter: "UsageMeter", model: str) -> None:
+        self.meter = meter
+        self.model = model
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, estimated_input: int):
+        context = current_context()
+        self.meter.check_quota(context.get("user_id"))
+        with self._lock:
+            self._runs[run_id] = (context, time.perf_counter(), estimated_input)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, sum(estimate_tokens(prompt) for prompt in prompts))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, sum(estimate_tokens(str(m.content)) for batch in messages for m in batch))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        context, started, estimated_input = run
+        try:
+            input_tokens, output_tokens = _usage_of(response, estimated_input)
+            self.meter.record(context, self.model, input_tokens, output_tokens, time.perf_counter() - started)
+        except Exception as e:
+            print(f"Failed to record LLM usage: {e}")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        context, started, estimated_input = run
+        try:
+            self.meter.record(context, self.model, estimated_input, 0, time.perf_counter() - started, error=True)
+        except Exception as e:
+            print(f"Failed to record LLM usage: {e}")
+
+
+class UsageMeter:
+    """
+    Aggregates LLM usage per (day, user, session, feature, model) and enforces daily quotas.
+
+    Counters are kept in memory and flushed to `collection` with one unordered bulk write
+    every `flush_interval` seconds, or as soon as `max_pending` rows are waiting. Quota
+    checks add this process's unflushed usage to the user's stored total for the day, which
+    is cached for `cache_seconds`. Other processes' most recent calls may be missing from
+    that total, so a quota can be overshot by at most a few calls.
+    """
+
+    def __init__(self, collection, quota_collection, prices: dict = None, daily_tokens: int = None,
+                 daily_cost_usd: float = None, flush_interval: float = 10, max_pending: int = 500,
+                 cache_seconds: float = 60) -> None:
+        self.collection = collection
+        self.quota_collection = quota_collection
+        self.prices = prices or dict(DEFAULT_PRICES)
+        self.default_quota = {"daily_tokens": daily_tokens, "daily_cost_usd": daily_cost_usd}
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.cache_seconds = cache_seconds
+        self._pending = {}
+        self._totals = {}
+        self._quotas = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._indexed = False
+        threading.Thread(target=self._flush_loop, name="usage-meter", daemon=True).start()
+        atexit.register(self.flush)
+
+    def cost(self, model: str, input_tokens: int, output_tokens: int) -> float:
+        input_price, output_price = self.prices.get(model, (0.0, 0.0))
+        return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+    def record(self, context: dict, model: str, input_tokens: int, output_tokens: int,
+               latency: float, error: bool = False) -> None:
+        key = (today(), context.get("user_id"), context.get("session_id"), context.get("feature", "other"), model)
+        increments = {
+            "calls": 1,
+            "errors": int(error),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cost_usd": self.cost(model, input_tokens, output_tokens),
+            "latency_seconds": latency,
+        }
+        with self._lock:
+            row = self._pending.setdefault(key, {**dict.fromkeys(COUNTERS, 0), "max_latency_seconds": 0.0})
+            for name, value in increments.items():
+                row[name] += value
+            row["max_latency_seconds"] = max(row["max_latency_seconds"], latency)
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """Writes the pending counters to MongoDB, returns the number of rows written."""
+        from pymongo import UpdateOne
+
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            operations = []
+            for (day, user_id, session_id, feature, model), row in pending.items():
+                operations.append(UpdateOne(
+                    {"day": day, "user_id": user_id, "session_id": session_id, "feature": feature, "model": model},
+                    {
+                        "$inc": {name: row[name] for name in COUNTERS},
+                        "$max": {"max_latency_seconds": row["max_latency_seconds"]},
+                        "$set": {"updated_at": datetime.datetime.now(datetime.timezone.utc)},
+                    },
+                    upsert=True
+                ))
+            try:
+                if not self._indexed:
+                    self.collection.create_index([("user_id", 1), ("day", 1)])
+                    self._indexed = True
+                self.collection.bulk_write(operations, ordered=False)
+            except Exception as e:
+                print(f"Failed to write LLM usage, retrying on the next flush: {e}")
+                with self._lock:
+                    for key, row in pending.items():
+                        merged = self._pending.setdefault(key, {**dict.fromkeys(COUNTERS, 0), "max_latency_seconds": 0.0})
+                        for name in COUNTERS:
+                            merged[name] += row[name]
+                        merged["max_latency_seconds"] = max(merged["max_latency_seconds"], row["max_latency_seconds"])
+                return 0
+
+            with self._lock:
+                # Keep cached totals in line with what was just written.
+                for (day, user_id, *_), row in pending.items():
+                    cached = self._totals.get((day, user_id))
+                    if cached:
+                        cached["tokens"] += row["input_tokens"] + row["output_tokens"]
+                        cached["cost_usd"] += row["cost_usd"]
+            return len(operations)
+
+    def usage_today(self, user_id: str) -> dict:
+        """Returns the tokens and cost used by a user today, stored and not yet flushed."""
+        day = today()
+        with self._lock:
+            cached = self._totals.get((day, user_id))
+        if cached is None or time.monotonic() - cached["fetched_at"] > self.cache_seconds:
+            stored = list(self.collection.aggregate([
+                {"$match": {"user_id": user_id, "day": day}},
+                {"$group": {
+                    "_id": None,
+                    "input_tokens": {"$sum": "$input_tokens"},
+                    "output_tokens": {"$sum": "$output_tokens"},
+                    "cost_usd": {"$sum": "$cost_usd"},
+                }},
+            ]))
+            row = stored[0] if stored else {}
+            cached = {
+                "fetched_at": time.monotonic(),
+                "tokens": row.get("input_tokens", 0) + row.get("output_tokens", 0),
+                "cost_usd": row.get("cost_usd", 0.0),
+            }
+            with self._lock:
+                self._totals[(day, user_id)] = cached
+
+        with self._lock:
+            tokens, cost = cached["tokens"], cached["cost_usd"]
+            for (row_day, row_user, *_), row in self._pending.items():
+                if row_day == day and row_user == user_id:
+                    tokens += row["input_tokens"] + row["output_tokens"]
+                    cost += row["cost_usd"]
+        return {"tokens": tokens, "cost_usd": cost}
+
+    def quota_for(self, user_id: str) -> dict:
+        """Returns the user's daily limits, a per-user override or the configured defaults."""
+        with self._lock:
+            cached = self._quotas.get(user_id)
+        if cached is None or time.monotonic() - cached[0] > self.cache_seconds:
+            override = self.quota_collection.find_one({"_id": user_id}) or {}
+            quota = {name: override.get(name, default) for name, default in self.default_quota.items()}
+            cached = (time.monotonic(), quota)
+            with self._lock:
+                self._quotas[user_id] = cached
+        return dict(cached[1])
+
+    def set_quota(self, user_id: str, daily_tokens: int = None, daily_cost_usd: float = None) -> None:
+        """Stores a per-user quota, None for a limit means unlimited."""
+        self.quota_collection.replace_one(
+            {"_id": user_id},
+            {"_id": user_id, "daily_tokens": daily_tokens, "daily_cost_usd": daily_cost_usd},
+            upsert=True
+        )
+        with self._lock:
+            self._quotas.pop(user_id, None)
+
+    def remove_quota(self, user_id: str) -> None:
+        """Drops a per-user quota, the user gets the default limits again."""
+        self.quota_collection.delete_one({"_id": user_id})
+        with self._lock:
+            self._quotas.pop(user_id, None)
+
+    def check_quota(self, user_id: str) -> None:
+        """
+        Raises `QuotaExceededError` if the user has used up a daily limit.
+
+        If the quota or the usage cannot be read, the error is logged and the call is let
+        through, an unavailable usage store should not stop the app from answering.
+        """
+        if not user_id:
+            return
+        try:
+            quota = self.quota_for(user_id)
+            if quota["daily_tokens"] is None and quota["daily_cost_usd"] is None:
+                return
+            used = self.usage_today(user_id)
+        except Exception as e:
+            print(f"Failed to check the quota of {user_id}, allowing the call: {e}")
+            return
+        if quota["daily_tokens"] is not None and used["tokens"] >= quota["daily_tokens"]:
+            raise QuotaExceededError(
+                f"Daily quota of {quota['daily_tokens']} tokens reached for {user_id}, it resets at midnight UTC."
+            )
+        if quota["daily_cost_usd"] is not None and used["cost_usd"] >= quota["daily_cost_usd"]:
+            raise QuotaExceededError(
+                f"Daily quota of ${quota['daily_cost_usd']:.2f} reached for {user_id}, it resets at midnight UTC."
+            )
+
+    def callback(self, model: str) -> UsageCallbackHandler:
+        return UsageCallbackHandler(self, model)
+
+    def usage_report(self, days: int = 30, group_by: tuple = ("user_id",)) -> list:
+        """Returns usage totals of the last `days` days grouped by the given fields, flushing first."""
+        self.flush()
+        since = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        rows = self.collection.aggregate([
+            {"$match": {"day": {"$gte": since}}},
+            {"$group": {
+                "_id": {field: f"${field}" for field in group_by},
+                **{name: {"$sum": f"${name}"} for name in COUNTERS},
+                "max_latency_seconds": {"$max": "$max_latency_seconds"},
+            }},
+            {"$sort": {"cost_usd": -1}},
+        ])
+        report = []
+        for row in rows:
+            group = row.pop("_id")
+            row["avg_latency_seconds"] = row["latency_seconds"] / row["calls"] if row["calls"] else 0.0
+            report.append({**group, **row})
+        return report
+
+
+def _optional_number(name: str, cast):
+    value = os.environ.get(name, "").strip()
+    return cast(value) if value else None
+
+
+_meter = None
+_meter_lock = threading.Lock()
+
+
+def get_meter() -> UsageMeter:
+    """Returns the process-wide meter, configured from USER_DAILY_TOKEN_QUOTA, USER_DAILY_COST_QUOTA and GEMINI_PRICES."""
+    global _meter
+    with _meter_lock:
+        if _meter is None:
+            from utils.database import prepare_db_coll
+            _meter = UsageMeter(
+                collection=prepare_db_coll("llm_usage"),
+                quota_collection=prepare_db_coll("usage_quotas"),
+                prices=parse_prices(os.environ.get("GEMINI_PRICES", "")),
+                daily_tokens=_optional_number("USER_DAILY_TOKEN_QUOTA", int),
+                daily_cost_usd=_optional_number("USER_DAILY_COST_QUOTA", float),
+                flush_interval=float(os.environ.get("USAGE_FLUSH_SECONDS", "10")),
+            )
+        return _meter
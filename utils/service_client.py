@@ -0,0 +1,82 @@
+import json
+import os
+import requests
+
+
+class ServiceClient:
+    """
+    Client of the headless chat service (`service.py`) acting for one user.
+
+    Used by the Streamlit app when STUDY_BUDDY_SERVICE_URL is set, the app then only renders
+    and every session, upload and chat turn is handled by the service workers.
+    """
+
+    def __init__(self, base_url: str, user_email: str, token: str = None, timeout: float = 30) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.headers = {"X-User-Email": user_email}
+        if token:
+            self.headers["Authorization"] = f"Bearer {token}"
+
+    def _request(self, method: str, path: str, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        response = requests.request(method, f"{self.base_url}{path}", headers=self.headers, **kwargs)
+        if response.status_code >= 400:
+            try:
+                message = response.json().get("error", response.text)
+            except ValueError:
+                message = response.text
+            raise RuntimeError(f"Chat service error {response.status_code}: {message}")
+        return response
+
+    def list_sessions(self, before: str = None, since: str = None, limit: int = 20) -> tuple:
+        """Returns a page of (session_id, unique_session_name) tuples, newest first, and the next page cursor."""
+        params = {"limit": limit or 0}
+        if before:
+            params["before"] = before
+        if since:
+            params["since"] = since
+        page = self._request("GET", "/sessions", params=params).json()
+        return [(session["id"], session["name"]) for session in page["sessions"]], page["next"]
+
+    def search_sessions(self, text: str, limit: int = 20) -> list:
+        """Returns the (session_id, unique_session_name) tuples of the chats matching `text`."""
+        page = self._request("GET", "/sessions", params={"q": text, "limit": limit}).json()
+        return [(session["id"], session["name"]) for session in page["sessions"]]
+
+    def create_session(self, session_name: str = "New Chat") -> tuple:
+        session = self._request("POST", "/sessions", json={"name": session_name}).json()
+        return session["id"], session["name"]
+
+    def messages(self, session_id, limit: int = 50) -> list:
+        """Returns the latest messages of a session as {"kind", "content"} dicts."""
+        return self._request("GET", f"/sessions/{session_id}/messages", params={"limit": limit}).json()
+
+    def upload_document(self, session_id, file_name: str, file_content: bytes) -> dict:
+        return self._request(
+            "POST", f"/sessions/{session_id}/documents",
+            params={"file_name": file_name}, data=file_content, timeout=max(self.timeout, 120)
+        ).json()
+
+    def document_status(self, session_id):
+        """Returns the ingestion status of the session's document, None if it has none."""
+        return self._request("GET", f"/sessions/{session_id}/documents").json()
+
+    def chat(self, session_id, message: str):
+        """Sends a chat turn and yields its events (status, token, title, then done or error)."""
+        response = self._request(
+            "POST", f"/sessions/{session_id}/chat",
+            json={"message": message}, stream=True, timeout=(self.timeout, None)
+        )
+        with response:
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+
+def get_service_client(user_email: str):
+    """Returns a `ServiceClient` if the app is configured to use the chat service, else None."""
+    base_url = os.environ.get("STUDY_BUDDY_SERVICE_URL", "").strip()
+    if not base_url or not user_email:
+        return None
+    return ServiceClient(base_url, user_email, token=os.environ.get("STUDY_BUDDY_SERVICE_TOKEN"))
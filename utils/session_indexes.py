@@ -0,0 +1,24 @@
+"""
+One-off setup of the chat session indexes.
+
+Run `python -m utils.session_indexes` once per database, and again after upgrading from a
+version without chat search. It stores the plain title of older sessions and builds the
+indexes behind the paginated session list and the chat search. Building the text index
+reads every message, so run it outside of peak hours on large databases.
+"""
+import argparse
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Create the chat session list and search indexes.")
+    parser.add_argument("--batch-size", type=int, default=500, help="Sessions updated per bulk write")
+    args = parser.parse_args()
+
+    from utils.database import backfill_session_titles, create_session_indexes
+
+    print(f"Stored the title of {backfill_session_titles(args.batch_size)} older chat sessions.")
+    create_session_indexes()
+    print("Chat session indexes are ready.")
@@ -0,0 +1,102 @@
+"""
+Warm-up and import-time measurement for the heavy modules the pages load lazily.
+
+Run `python -m utils.warmup` to print the cold import time of each module, every module is
+imported in a fresh interpreter so the numbers do not hide each other's shared dependencies.
+"""
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# Modules deferred by the pages until first use, roughly in the order a chat needs them.
+HEAVY_MODULES = [
+    "langchain_core.messages",
+    "langchain_google_genai",
+    "langchain.agents",
+    "langchain_community.tools.tavily_search",
+    "langchain_community.vectorstores",
+    "PyPDF2",
+    "docx",
+    "pandas",
+    "agent",
+    "ext_tools.instant_rag",
+    "ext_tools.qa_tool",
+    "utils.callbacks",
+]
+
+warmup_timings = {}
+
+
+def warm_up(build_clients: bool = True) -> dict:
+    """
+    Imports the heavy modules and optionally builds the cached LLM clients.
+
+    Returns:
+        dict: Seconds spent on each step, also kept in `warmup_timings`.
+    """
+    for module in HEAVY_MODULES:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            print(f"Warm-up could not import {module}: {e}")
+            continue
+        warmup_timings[module] = time.perf_counter() - start
+
+    if build_clients:
+        start = time.perf_counter()
+        try:
+            from agent import get_llm, get_summary_chain
+            from ext_tools.qa_tool import get_qa_chain
+            get_llm()
+            get_summary_chain()
+            get_qa_chain()
+        except Exception as e:
+            print(f"Warm-up could not build the LLM clients: {e}")
+        warmup_timings["clients"] = time.perf_counter() - start
+
+    print(f"Warm-up finished in {sum(warmup_timings.values()):.2f}s")
+    return dict(warmup_timings)
+
+
+def start_background_warm_up() -> threading.Thread:
+    """Runs `warm_up()` on a daemon thread so the first page render is not delayed."""
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def warm_up_enabled() -> bool:
+    return os.environ.get("STUDY_BUDDY_WARMUP", "").strip().lower() in ("1", "true", "yes")
+
+
+def measure_import_times(modules: list = None) -> list:
+    """Returns (module, seconds) pairs for a cold import of each module, slowest first."""
+    code = (
+        "import importlib, sys, time, warnings\n"
+        "warnings.simplefilter('ignore')\n"
+        "start = time.perf_counter()\n"
+        "importlib.import_module(sys.argv[1])\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for module in modules or ["streamlit", "pymongo"] + HEAVY_MODULES:
+        completed = subprocess.run(
+            [sys.executable, "-c", code, module],
+            capture_output=True, text=True, cwd=root
+        )
+        try:
+            seconds = float(completed.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            seconds = float("nan")
+        results.append((module, seconds))
+    return sorted(results, key=lambda item: item[1], reverse=True)
+
+
+if __name__ == "__main__":
+    for module, seconds in measure_import_times(sys.argv[1:] or None):
+        print(f"{seconds:8.3f}s  {module}")